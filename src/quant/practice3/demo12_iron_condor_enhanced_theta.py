@@ -45,27 +45,23 @@ IC_MODE=continuous uv run demo12_iron_condor_enhanced.py
 ================================================================================
 """
 import asyncio
+import bisect
 import os
-import math
-import json
 import logging
-from datetime import datetime
+import time
+from collections import OrderedDict
+from datetime import date, datetime
 from typing import Optional, Tuple, Dict, Any
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 
 from ib_async import IB, Stock, Option, MarketOrder, LimitOrder, Contract, ComboLeg, TagValue
 
-# 导入仓位管理模块
-try:
-    from position_manager import (
-        PositionManager, AdjustmentAction,
-        check_iron_condor_adjustment, format_adjustment_report
-    )
-except ImportError:
-    # 如果模块不存在，提供基本实现
-    PositionManager = None
+from state_store import StateStore, DB_FILE
+from runtime import run
+from market_data import TickerPool, has_price, wait_for_done
 
-logging.basicConfig(level=logging.INFO,
+# IC_LOG_LEVEL=WARNING 可关闭 INFO 日志（cron 下减少输出）
+logging.basicConfig(level=os.getenv("IC_LOG_LEVEL", "INFO").upper(),
                     format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
@@ -96,12 +92,25 @@ RUN_MODE = os.getenv("IC_MODE", "daily")
 USE_DELAYED_DATA = os.getenv("IC_USE_DELAYED", "true").lower() == "true"
 SIMULATION_MODE = os.getenv("IC_SIMULATION", "false").lower() == "true"
 
-# 状态文件
-STATE_DIR = os.path.join(os.path.dirname(__file__), ".states")
-STATE_FILE = os.path.join(STATE_DIR, f"iron_condor_{SYMBOL.lower()}.json")
+# 仓位存储（SQLite WAL，见 state_store.py）
+position_store = StateStore("iron_condor", SYMBOL)
+
+# 期权链缓存: (symbol, conId, 日期) -> (获取时间, 到期日列表, 行权价列表)
+# 键中包含日期，跨日后"未到期"过滤结果自动失效
+CHAIN_CACHE_TTL_SEC = 3600
+_chain_cache: Dict[Tuple[str, int, str], Tuple[float, list, list]] = {}
+
+# 已确认合约的 LRU 缓存: (symbol, right, strike, expiry) -> Option
+QUALIFIED_CACHE_SIZE = 64
+_qualified_options: "OrderedDict[Tuple[str, str, float, str], Option]" = OrderedDict()
+
 
+def parse_expiry(expiry: str) -> date:
+    """解析 YYYYMMDD 到期日（直接切片，比 strptime 快）"""
+    return date(int(expiry[:4]), int(expiry[4:6]), int(expiry[6:8]))
 
-@dataclass
+
+@dataclass(slots=True)
 class IronCondorPosition:
     """Iron Condor 仓位"""
     short_call_strike: float = 0.0
@@ -114,28 +123,55 @@ class IronCondorPosition:
     current_value: float = 0.0
     entry_price: float = 0.0  # 建仓时股价
     entry_date: str = ""      # 建仓日期
+    # 四条腿的 conId，非 0 时可直接构造合约，跳过 qualifyContractsAsync
+    short_call_conid: int = 0
+    short_put_conid: int = 0
+    long_call_conid: int = 0
+    long_put_conid: int = 0
+    # 派生字段：行权价/到期日建仓后不变，只算一次
+    call_wing: float = field(init=False, repr=False, compare=False)
+    _expiry_date: Optional[date] = field(init=False, default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.call_wing = self.long_call_strike - self.short_call_strike
 
     def get_max_profit(self) -> float:
         return self.initial_credit
 
     def get_max_loss(self) -> float:
-        call_wing = self.long_call_strike - self.short_call_strike
-        return call_wing * 100 * self.contracts - self.initial_credit
+        return self.call_wing * 100 * self.contracts - self.initial_credit
 
     def get_profit_range(self) -> Tuple[float, float]:
         return (self.short_put_strike, self.short_call_strike)
 
-    def get_days_to_expiry(self) -> int:
+    def get_days_to_expiry(self, today: Optional[date] = None) -> int:
         if not self.expiry:
             return 999
         try:
-            expiry_date = datetime.strptime(self.expiry, "%Y%m%d")
-            return (expiry_date.date() - datetime.now().date()).days
-        except:
+            if self._expiry_date is None:
+                self._expiry_date = parse_expiry(self.expiry)
+            return (self._expiry_date - (today or date.today())).days
+        except ValueError:
             return 999
 
     def to_dict(self) -> Dict:
-        return asdict(self)
+        # 字段均为标量，直接构造比 asdict 的递归深拷贝更快
+        return {
+            'short_call_strike': self.short_call_strike,
+            'short_put_strike': self.short_put_strike,
+            'long_call_strike': self.long_call_strike,
+            'long_put_strike': self.long_put_strike,
+            'expiry': self.expiry,
+            'contracts': self.contracts,
+            'initial_credit': self.initial_credit,
+            'current_value': self.current_value,
+            'entry_price': self.entry_price,
+            'entry_date': self.entry_date,
+            'short_call_conid': self.short_call_conid,
+            'short_put_conid': self.short_put_conid,
+            'long_call_conid': self.long_call_conid,
+            'long_put_conid': self.long_put_conid,
+        }
 
     @classmethod
     def from_dict(cls, data: Dict) -> 'IronCondorPosition':
@@ -143,14 +179,10 @@ class IronCondorPosition:
 
 
 def load_position() -> Optional[IronCondorPosition]:
-    """从文件加载仓位（用于获取建仓时的元数据）"""
-    os.makedirs(STATE_DIR, exist_ok=True)
-    if not os.path.exists(STATE_FILE):
-        return None
+    """从仓位存储加载仓位（用于获取建仓时的元数据）"""
     try:
-        with open(STATE_FILE, 'r') as f:
-            data = json.load(f)
-            return IronCondorPosition.from_dict(data['position'])
+        data = position_store.load()
+        return IronCondorPosition.from_dict(data) if data else None
     except Exception as e:
         logger.error(f"加载仓位失败: {e}")
         return None
@@ -180,7 +212,7 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[IronCondorPos
         return None
     
     # 解析持仓
-    calls = []  # (strike, position, expiry)
+    calls = []  # (strike, position, expiry, conId)
     puts = []
     
     for p in option_positions:
@@ -190,9 +222,9 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[IronCondorPos
         qty = p.position
         
         if opt.right == "C":
-            calls.append((strike, qty, expiry))
+            calls.append((strike, qty, expiry, opt.conId))
         else:
-            puts.append((strike, qty, expiry))
+            puts.append((strike, qty, expiry, opt.conId))
     
     # 检查是否符合 Iron Condor 结构
     # 需要: 2 个 call (1正1负), 2 个 put (1正1负)
@@ -201,10 +233,10 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[IronCondorPos
         return None
     
     # 找出 short/long 腿
-    short_calls = [(s, q, e) for s, q, e in calls if q < 0]
-    long_calls = [(s, q, e) for s, q, e in calls if q > 0]
-    short_puts = [(s, q, e) for s, q, e in puts if q < 0]
-    long_puts = [(s, q, e) for s, q, e in puts if q > 0]
+    short_calls = [leg for leg in calls if leg[1] < 0]
+    long_calls = [leg for leg in calls if leg[1] > 0]
+    short_puts = [leg for leg in puts if leg[1] < 0]
+    long_puts = [leg for leg in puts if leg[1] > 0]
     
     if not (short_calls and long_calls and short_puts and long_puts):
         logger.info("持仓不完整，缺少 Iron Condor 部分腿")
@@ -224,9 +256,11 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[IronCondorPos
     lp_qty = int(abs(long_puts[0][1]))
     contracts = min(sc_qty, lc_qty, sp_qty, lp_qty)
     
-    logger.info(f"✅ 检测到 Iron Condor 持仓:")
-    logger.info(f"   买Put ${long_put_strike} | 卖Put ${short_put_strike} | 卖Call ${short_call_strike} | 买Call ${long_call_strike}")
-    logger.info(f"   到期日: {expiry}, 合约数: {contracts} (各腿: LP={lp_qty}, SP={sp_qty}, SC={sc_qty}, LC={lc_qty})")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"✅ 检测到 Iron Condor 持仓:\n"
+            f"   买Put ${long_put_strike} | 卖Put ${short_put_strike} | 卖Call ${short_call_strike} | 买Call ${long_call_strike}\n"
+            f"   到期日: {expiry}, 合约数: {contracts} (各腿: LP={lp_qty}, SP={sp_qty}, SC={sc_qty}, LC={lc_qty})")
     
     # 尝试从本地文件获取建仓时的元数据
     local_position = load_position()
@@ -244,34 +278,79 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[IronCondorPos
         initial_credit=initial_credit,
         current_value=0.0,  # 稍后更新
         entry_price=entry_price,
-        entry_date=entry_date
+        entry_date=entry_date,
+        short_call_conid=short_calls[0][3],
+        short_put_conid=short_puts[0][3],
+        long_call_conid=long_calls[0][3],
+        long_put_conid=long_puts[0][3],
     )
 
 
+# 上次写入的仓位内容，未变化时跳过写入
+_last_saved_position: Optional[Dict] = None
+
+
 def save_position(position: IronCondorPosition):
-    """保存仓位到文件（记录建仓时的元数据）"""
-    os.makedirs(STATE_DIR, exist_ok=True)
-    data = {
-        'position': position.to_dict(),
-        'last_updated': datetime.now().isoformat(),
-        'symbol': SYMBOL
-    }
-    with open(STATE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-    logger.info(f"仓位已保存: {STATE_FILE}")
+    """保存仓位（记录建仓时的元数据），单行 INSERT OR REPLACE"""
+    global _last_saved_position
+    position_data = position.to_dict()
+    # 内容未变且库中记录仍在时跳过；记录被清除（其他进程清仓/手工删除）时照常重写
+    if position_data == _last_saved_position and position_store.load() is not None:
+        return
+
+    position_store.save(position_data)
+    _last_saved_position = position_data
+    logger.info(f"仓位已保存: {DB_FILE} ({position_store.strategy_name}/{position_store.symbol})")
 
 
 def clear_position():
     """清除仓位"""
-    if os.path.exists(STATE_FILE):
-        os.remove(STATE_FILE)
+    global _last_saved_position
+    _last_saved_position = None
+    if position_store.clear():
         logger.info("仓位已清除")
 
 
+# 期权持仓索引: (symbol, right, strike, expiry) -> 持仓数量，由 positionEvent 增量维护
+option_position_index: Dict[Tuple[str, str, float, str], float] = {}
+
+
+def index_position(position):
+    """positionEvent 回调：更新期权持仓索引"""
+    c = position.contract
+    if c.secType != "OPT":
+        return
+    key = (c.symbol, c.right, c.strike, c.lastTradeDateOrContractMonth)
+    if position.position:
+        option_position_index[key] = position.position
+    else:
+        option_position_index.pop(key, None)
+
+
+def find_missing_legs(position: IronCondorPosition) -> list:
+    """对照持仓索引检查四条腿（O(1) 查找），返回缺失腿的简称"""
+    legs = (
+        ("SC", "C", position.short_call_strike, -1),
+        ("LC", "C", position.long_call_strike, 1),
+        ("SP", "P", position.short_put_strike, -1),
+        ("LP", "P", position.long_put_strike, 1),
+    )
+    missing = []
+    for name, right, strike, sign in legs:
+        qty = option_position_index.get((SYMBOL, right, strike, position.expiry), 0)
+        if qty * sign <= 0:
+            missing.append(name)
+    return missing
+
+
 async def connect_ib() -> IB:
     ib = IB()
     await ib.connectAsync(IB_HOST, IB_PORT, clientId=IB_CLIENT_ID)
     ib.reqMarketDataType(3 if USE_DELAYED_DATA else 1)
+    # 用连接时已同步的持仓初始化索引，之后由事件驱动更新
+    for position in ib.positions():
+        index_position(position)
+    ib.positionEvent += index_position
     return ib
 
 
@@ -300,45 +379,149 @@ async def cancel_all_option_orders(ib: IB, symbol: str):
         logger.info("无挂单需要取消")
 
 
+def first_valid_price(*values, default: float) -> float:
+    """返回第一个非零、非 NaN 的价格（NaN != NaN）"""
+    for v in values:
+        if v and v == v:
+            return v
+    return default
+
+
 async def get_stock_price(ib: IB, stock: Stock) -> float:
     ticker = ib.reqMktData(stock, "", False, False)
     await asyncio.sleep(2)
-    price = ticker.last or ticker.close or FALLBACK_PRICE
     ib.cancelMktData(stock)
-    return price if price and not math.isnan(price) else FALLBACK_PRICE
+    return first_valid_price(ticker.last, ticker.close, default=FALLBACK_PRICE)
 
 
-async def get_option_price(ib: IB, option: Option) -> float:
-    ticker = ib.reqMktData(option, "", False, False)
-    await asyncio.sleep(2)
-    price = ticker.last or ticker.close or (
-        (ticker.bid or 0) + (ticker.ask or 0)) / 2
-    ib.cancelMktData(option)
-    return price if price and not math.isnan(price) else 0.0
+def has_option_price(ticker) -> bool:
+    return has_price(ticker) or (ticker.bid > 0 and ticker.ask > 0)
 
 
-async def find_option(ib: IB, stock: Stock, right: str, strike: float, expiry: str) -> Optional[Option]:
-    option = Option(stock.symbol, expiry, strike, right, "SMART")
-    try:
-        qualified = await ib.qualifyContractsAsync(option)
-        return qualified[0] if qualified else None
-    except:
-        return None
+# 期权腿行情订阅池：持续模式下后续周期直接读取实时 ticker，平仓/展期后调用 release_legs 释放
+leg_pool = TickerPool()
+# conId -> (最近一次有效价格, 时间戳)，ticker 暂无报价时兜底
+_last_leg_prices: Dict[int, Tuple[float, float]] = {}
+
+
+def release_legs(ib: IB):
+    """取消全部期权腿订阅"""
+    leg_pool.release(ib)
+    _last_leg_prices.clear()
+
+
+async def get_option_prices(ib: IB, options: list) -> list:
+    """获取多条腿价格（共用订阅池，新订阅的腿同时等待）"""
+    tickers = await asyncio.gather(*(leg_pool.get(ib, option, has_option_price) for option in options))
+    now = time.time()
+    prices = []
+    for option, ticker in zip(options, tickers):
+        mid = 0.5 * (ticker.bid + ticker.ask) if ticker.bid and ticker.ask else 0.0
+        price = first_valid_price(ticker.last, ticker.close, mid, default=0.0)
+        if price:
+            _last_leg_prices[option.conId] = (price, now)
+        else:
+            # 报价短暂缺失时使用上一次检查的有效价格，避免误算盈亏
+            # （两次读取之间除了 CHECK_INTERVAL_SEC 还有取股价等等待，窗口取两个周期）
+            cached = _last_leg_prices.get(option.conId)
+            if cached and now - cached[1] < 2 * CHECK_INTERVAL_SEC:
+                price = cached[0]
+        prices.append(price)
+    return prices
+
+
+async def find_options(ib: IB, stock: Stock, specs: list) -> list:
+    """
+    批量确认期权合约
+
+    specs: [(right, strike, expiry), ...]
+    返回与 specs 对应的合约列表，无法确认的位置为 None。
+    缓存未命中的合约在一次 qualifyContractsAsync 调用中确认。
+    """
+    results: list = [None] * len(specs)
+    pending = []  # (index, key, option)
+    for i, (right, strike, expiry) in enumerate(specs):
+        key = (stock.symbol, right, strike, expiry)
+        cached = _qualified_options.get(key)
+        if cached is not None:
+            _qualified_options.move_to_end(key)
+            results[i] = cached
+        else:
+            pending.append((i, key, Option(stock.symbol, expiry, strike, right, "SMART")))
+
+    if pending:
+        try:
+            await ib.qualifyContractsAsync(*(option for _, _, option in pending))
+        except Exception as e:
+            logger.warning(f"确认期权合约失败: {e}")
+            return results
+        # qualifyContractsAsync 原地补全合约，conId 非 0 即确认成功
+        for i, key, option in pending:
+            if option.conId:
+                results[i] = option
+                _qualified_options[key] = option
+        while len(_qualified_options) > QUALIFIED_CACHE_SIZE:
+            _qualified_options.popitem(last=False)
+    return results
+
+
+async def get_position_legs(ib: IB, stock: Stock, position: IronCondorPosition) -> Tuple:
+    """获取仓位四条腿合约 (sc, sp, lc, lp)，优先使用保存的 conId"""
+    conids = (position.short_call_conid, position.short_put_conid,
+              position.long_call_conid, position.long_put_conid)
+    specs = (("C", position.short_call_strike), ("P", position.short_put_strike),
+             ("C", position.long_call_strike), ("P", position.long_put_strike))
+    if all(conids):
+        return tuple(
+            Option(stock.symbol, position.expiry, strike, right, "SMART", conId=conid)
+            for conid, (right, strike) in zip(conids, specs)
+        )
+    return tuple(await find_options(
+        ib, stock, [(right, strike, position.expiry) for right, strike in specs]))
 
 
 async def get_option_chain_info(ib: IB, stock: Stock) -> Tuple[list, list]:
+    # 展期/加仓会重复调用，1 小时内直接复用缓存的期权链
+    today = datetime.now().strftime("%Y%m%d")
+    cache_key = (stock.symbol, stock.conId, today)
+    cached = _chain_cache.get(cache_key)
+    if cached and time.time() - cached[0] < CHAIN_CACHE_TTL_SEC:
+        return cached[1], cached[2]
+
     chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
     if not chains:
         return [], []
     chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
-    today = datetime.now().strftime("%Y%m%d")
-    return sorted([e for e in chain.expirations if e > today]), sorted(chain.strikes)
+    # YYYYMMDD 字符串按字典序即按日期排序，二分定位第一个未到期日
+    expirations = sorted(chain.expirations)
+    expiries = expirations[bisect.bisect_right(expirations, today):]
+    strikes = sorted(chain.strikes)
+    _chain_cache[cache_key] = (time.time(), expiries, strikes)
+    return expiries, strikes
+
+
+def nearest_strike(strikes: list, target: float,
+                   above: Optional[float] = None, below: Optional[float] = None) -> float:
+    """
+    在已排序的行权价中二分查找最接近 target 的行权价
+
+    above/below: 只在 (above, below) 开区间内选择；区间为空时返回最低行权价
+    """
+    lo = bisect.bisect_right(strikes, above) if above is not None else 0
+    hi = bisect.bisect_left(strikes, below) if below is not None else len(strikes)
+    if lo >= hi:
+        return strikes[0]
+    i = bisect.bisect_left(strikes, target, lo, hi)
+    # 最近值只可能是插入点两侧的相邻行权价
+    candidates = strikes[max(lo, i - 1):min(hi, i + 1)]
+    return min(candidates, key=lambda x: abs(x - target))
 
 
 def decide_adjustment(
     position: IronCondorPosition,
     current_price: float,
-    pnl_pct: float
+    pnl_pct: float,
+    today: Optional[date] = None
 ) -> Tuple[str, str]:
     """
     决定调仓动作
@@ -347,7 +530,7 @@ def decide_adjustment(
         action: hold/take_profit/stop_loss/roll_out/roll_up/roll_down/close
         reason: 原因说明
     """
-    days_to_expiry = position.get_days_to_expiry()
+    days_to_expiry = position.get_days_to_expiry(today)
 
     # 1. 止盈检查
     if pnl_pct >= PROFIT_TARGET_PCT:
@@ -381,16 +564,38 @@ def decide_adjustment(
     return ("hold", "持仓正常")
 
 
+BAR_LEN = 50
+
+
+def render_position_bar(position: IronCondorPosition, current_price: float, bar_len: int = BAR_LEN) -> str:
+    """把 [买Put, 买Call] 区间映射到定长 ASCII 条，标出卖Put/卖Call行权价和当前价格"""
+    # 单块 ASCII 缓冲区，避免逐格创建字符串
+    bar = bytearray(b"-" * bar_len)
+    range_width = position.long_call_strike - position.long_put_strike
+    if range_width <= 0:
+        return bar.decode("ascii")
+
+    scale = bar_len / range_width
+    for strike, glyph in ((position.short_put_strike, b"P"), (position.short_call_strike, b"C")):
+        idx = int((strike - position.long_put_strike) * scale)
+        if 0 <= idx < bar_len:
+            bar[idx] = glyph[0]
+    price_idx = max(0, min(bar_len - 1, int((current_price - position.long_put_strike) * scale)))
+    bar[price_idx] = ord("*")
+    return bar.decode("ascii")
+
+
 def print_daily_report(
     position: IronCondorPosition,
     current_price: float,
     pnl: float,
     pnl_pct: float,
     action: str,
-    reason: str
+    reason: str,
+    today: Optional[date] = None
 ):
     """打印每日报告"""
-    days = position.get_days_to_expiry()
+    days = position.get_days_to_expiry(today)
     profit_range = position.get_profit_range()
 
     print("\n" + "=" * 60)
@@ -411,25 +616,9 @@ def print_daily_report(
     print(f"  盈利区间: ${profit_range[0]:.0f} ~ ${profit_range[1]:.0f}")
 
     # 位置可视化
-    range_width = position.long_call_strike - position.long_put_strike
-    price_pos = (current_price - position.long_put_strike) / range_width
-    bar_len = 50
-    price_idx = max(0, min(bar_len - 1, int(price_pos * bar_len)))
-
-    put_idx = int((position.short_put_strike -
-                  position.long_put_strike) / range_width * bar_len)
-    call_idx = int((position.short_call_strike -
-                   position.long_put_strike) / range_width * bar_len)
-
-    bar = ["─"] * bar_len
-    if 0 <= put_idx < bar_len:
-        bar[put_idx] = "P"
-    if 0 <= call_idx < bar_len:
-        bar[call_idx] = "C"
-    bar[price_idx] = "●"
-
-    print(f"\n  [{''.join(bar)}]")
-    print(f"  P=卖Put行权价  C=卖Call行权价  ●=当前价格")
+    bar = render_position_bar(position, current_price)
+    print(f"\n  [{bar}]")
+    print(f"  P=卖Put行权价  C=卖Call行权价  *=当前价格")
 
     if profit_range[0] <= current_price <= profit_range[1]:
         print(f"  ✅ 价格在盈利区间内")
@@ -488,33 +677,30 @@ async def build_iron_condor(ib: IB, stock: Stock, price: float) -> IronCondorPos
     expiry = expiries[1] if len(expiries) > 1 else expiries[0]
 
     # 计算行权价
-    short_call = min(strikes, key=lambda x: abs(
-        x - price * (1 + SHORT_OTM_PCT)) if x > price else float('inf'))
-    short_put = min(strikes, key=lambda x: abs(
-        x - price * (1 - SHORT_OTM_PCT)) if x < price else float('inf'))
-    long_call = min(strikes, key=lambda x: abs(
-        x - price * (1 + LONG_OTM_PCT)) if x > short_call else float('inf'))
-    long_put = min(strikes, key=lambda x: abs(
-        x - price * (1 - LONG_OTM_PCT)) if x < short_put else float('inf'))
-
-    logger.info(f"构建 Iron Condor @ {expiry}")
-    logger.info(
-        f"  买Put ${long_put} | 卖Put ${short_put} | 卖Call ${short_call} | 买Call ${long_call}")
+    short_call = nearest_strike(strikes, price * (1 + SHORT_OTM_PCT), above=price)
+    short_put = nearest_strike(strikes, price * (1 - SHORT_OTM_PCT), below=price)
+    long_call = nearest_strike(strikes, price * (1 + LONG_OTM_PCT), above=short_call)
+    long_put = nearest_strike(strikes, price * (1 - LONG_OTM_PCT), below=short_put)
+
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            f"构建 Iron Condor @ {expiry}\n"
+            f"  买Put ${long_put} | 卖Put ${short_put} | 卖Call ${short_call} | 买Call ${long_call}")
 
     # 获取期权合约
-    sc = await find_option(ib, stock, "C", short_call, expiry)
-    sp = await find_option(ib, stock, "P", short_put, expiry)
-    lc = await find_option(ib, stock, "C", long_call, expiry)
-    lp = await find_option(ib, stock, "P", long_put, expiry)
+    sc, sp, lc, lp = await find_options(ib, stock, [
+        ("C", short_call, expiry),
+        ("P", short_put, expiry),
+        ("C", long_call, expiry),
+        ("P", long_put, expiry),
+    ])
 
     if not all([sc, sp, lc, lp]):
         raise RuntimeError("无法获取所有期权腿")
 
     # 获取期权价格
-    sc_price = await get_option_price(ib, sc)
-    sp_price = await get_option_price(ib, sp)
-    lc_price = await get_option_price(ib, lc)
-    lp_price = await get_option_price(ib, lp)
+    sc_price, sp_price, lc_price, lp_price = await get_option_prices(
+        ib, [sc, sp, lc, lp])
 
     # 净权利金 (卖出 - 买入)
     net_credit_per_contract = sc_price + sp_price - lc_price - lp_price
@@ -539,23 +725,16 @@ async def build_iron_condor(ib: IB, stock: Stock, price: float) -> IronCondorPos
         filled_trades = []
         total_credit = 0.0
         
+        # 使用市价单确保成交；4条腿先全部提交，再并发等待成交
+        trades = []
         for option, action, name in legs:
-            # 使用市价单确保成交
             order = MarketOrder(action, NUM_CONTRACTS)
-            trade = ib.placeOrder(option, order)
-            
+            trades.append(ib.placeOrder(option, order))
             logger.info(f"  {action} {name} @ 行权价 ${option.strike} x {NUM_CONTRACTS}")
-            
-            # 等待成交（最多 60 秒，大单需要更长时间）
-            for i in range(60):
-                await asyncio.sleep(1)
-                status = trade.orderStatus.status
-                filled = trade.orderStatus.filled
-                if status == "Filled":
-                    break
-                elif i % 10 == 9:
-                    logger.info(f"    等待中... 已成交 {filled}/{NUM_CONTRACTS}")
-            
+        
+        await asyncio.gather(*(wait_for_done(trade, 60) for trade in trades))
+        
+        for (option, action, name), trade in zip(legs, trades):
             if trade.orderStatus.status == "Filled":
                 fill_price = trade.orderStatus.avgFillPrice
                 # 卖出收权利金（正），买入付权利金（负）
@@ -583,25 +762,47 @@ async def build_iron_condor(ib: IB, stock: Stock, price: float) -> IronCondorPos
         initial_credit=net_credit,
         current_value=net_credit,
         entry_price=price,
-        entry_date=datetime.now().strftime("%Y-%m-%d")
+        entry_date=datetime.now().strftime("%Y-%m-%d"),
+        short_call_conid=sc.conId,
+        short_put_conid=sp.conId,
+        long_call_conid=lc.conId,
+        long_put_conid=lp.conId,
     )
 
 
+async def run_to_completion(coro):
+    """
+    运行 coro 直到结束，调用方被取消（SIGTERM/SIGINT）时也不打断它：
+    订单一旦提交到券商，必须等成交并保存仓位后才能退出，之后再继续抛出取消
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        logger.warning("下单进行中，等待成交并保存仓位后再退出...")
+        try:
+            await task
+        except Exception as e:
+            logger.error(f"退出前下单失败: {e}")
+        raise
+
+
+async def open_position(ib: IB, stock: Stock, price: float) -> IronCondorPosition:
+    """建立新仓位并立即保存"""
+    position = await build_iron_condor(ib, stock, price)
+    save_position(position)
+    return position
+
 
 async def update_position_value(ib: IB, stock: Stock, position: IronCondorPosition) -> float:
     """更新持仓价值，返回当前价值"""
-    sc = await find_option(ib, stock, "C", position.short_call_strike, position.expiry)
-    sp = await find_option(ib, stock, "P", position.short_put_strike, position.expiry)
-    lc = await find_option(ib, stock, "C", position.long_call_strike, position.expiry)
-    lp = await find_option(ib, stock, "P", position.long_put_strike, position.expiry)
+    sc, sp, lc, lp = await get_position_legs(ib, stock, position)
 
     if not all([sc, sp, lc, lp]):
         return position.current_value
 
-    sc_price = await get_option_price(ib, sc)
-    sp_price = await get_option_price(ib, sp)
-    lc_price = await get_option_price(ib, lc)
-    lp_price = await get_option_price(ib, lp)
+    sc_price, sp_price, lc_price, lp_price = await get_option_prices(
+        ib, [sc, sp, lc, lp])
 
     current_value = (sc_price + sp_price - lc_price -
                      lp_price) * 100 * NUM_CONTRACTS
@@ -615,14 +816,22 @@ async def execute_action(ib: IB, stock: Stock, position: IronCondorPosition, act
             pnl = position.initial_credit - position.current_value
             logger.info(f"[模拟] 平仓 Iron Condor, 盈亏: ${pnl:+.2f}")
         clear_position()
+        release_legs(ib)
         print("✅ 仓位已平仓")
 
     elif action == "roll_out":
-        # 平仓后重新建仓
+        # 先平旧仓、成功后再建新仓：新周期可能选到与旧仓相同的到期日和合约，
+        # 两边同时下单会交易同一合约；平仓失败时也不应再建新仓
         if SIMULATION_MODE:
             logger.info("[模拟] 展期: 平仓现有仓位并重新建仓")
-        new_position = await build_iron_condor(ib, stock, current_price)
-        save_position(new_position)
+        async def roll():
+            await close_iron_condor(ib, stock, position, position.contracts)
+            clear_position()
+            # 此时订阅池里只有旧周期的腿，新仓位建仓时重新订阅
+            release_legs(ib)
+            await open_position(ib, stock, current_price)
+
+        await run_to_completion(roll())
         print("✅ 已展期到新周期")
 
     elif action in ["roll_up", "roll_down"]:
@@ -646,20 +855,15 @@ async def close_iron_condor(ib: IB, stock: Stock, position: IronCondorPosition,
     logger.info(f"🔻 正在平仓 {close_qty} 张 Iron Condor...")
     
     # 获取期权合约
-    sc = await find_option(ib, stock, "C", position.short_call_strike, position.expiry)
-    sp = await find_option(ib, stock, "P", position.short_put_strike, position.expiry)
-    lc = await find_option(ib, stock, "C", position.long_call_strike, position.expiry)
-    lp = await find_option(ib, stock, "P", position.long_put_strike, position.expiry)
+    sc, sp, lc, lp = await get_position_legs(ib, stock, position)
     
     if not all([sc, sp, lc, lp]):
         raise RuntimeError("无法获取所有期权腿")
     
     if SIMULATION_MODE:
         # 模拟模式
-        sc_price = await get_option_price(ib, sc)
-        sp_price = await get_option_price(ib, sp)
-        lc_price = await get_option_price(ib, lc)
-        lp_price = await get_option_price(ib, lp)
+        sc_price, sp_price, lc_price, lp_price = await get_option_prices(
+            ib, [sc, sp, lc, lp])
         
         # 平仓权利金 = 买入short - 卖出long
         close_debit = (sc_price + sp_price - lc_price - lp_price) * 100 * close_qty
@@ -676,20 +880,16 @@ async def close_iron_condor(ib: IB, stock: Stock, position: IronCondorPosition,
         
         total_debit = 0.0
         
+        # 4条腿同时提交，再并发等待成交
+        trades = []
         for option, action, name in legs:
             order = MarketOrder(action, close_qty)
-            trade = ib.placeOrder(option, order)
-            
+            trades.append(ib.placeOrder(option, order))
             logger.info(f"  {action} {name} @ 行权价 ${option.strike} x {close_qty}")
-            
-            # 等待成交
-            for i in range(60):
-                await asyncio.sleep(1)
-                if trade.orderStatus.status == "Filled":
-                    break
-                elif i % 10 == 9:
-                    logger.info(f"    等待中... 已成交 {trade.orderStatus.filled}/{close_qty}")
-            
+        
+        await asyncio.gather(*(wait_for_done(trade, 60) for trade in trades))
+        
+        for (option, action, name), trade in zip(legs, trades):
             if trade.orderStatus.status == "Filled":
                 fill_price = trade.orderStatus.avgFillPrice
                 if action == "BUY":
@@ -739,6 +939,8 @@ async def close_all_positions(ib: IB):
     
     total_pnl = 0.0
     
+    # 先提交所有平仓单，再并发等待成交，总耗时取决于最慢的一条腿
+    submitted = []  # (trade, action, qty)
     for p in option_positions:
         contract = p.contract
         qty = int(abs(p.position))
@@ -755,17 +957,14 @@ async def close_all_positions(ib: IB):
         
         order = MarketOrder(action, qty)
         trade = ib.placeOrder(qualified[0], order)
+        submitted.append((trade, action, qty))
         
         logger.info(f"  {action} {contract.right} ${contract.strike} x {qty}")
-        
-        # 等待成交
-        for i in range(60):
-            await asyncio.sleep(1)
-            if trade.orderStatus.status == "Filled":
-                break
-            elif i % 10 == 9:
-                logger.info(f"    等待中... 已成交 {trade.orderStatus.filled}/{qty}")
-        
+    
+    await asyncio.gather(*(wait_for_done(trade, 60) for trade, _, _ in submitted))
+    
+    for trade, action, qty in submitted:
+        contract = trade.contract
         if trade.orderStatus.status == "Filled":
             fill_price = trade.orderStatus.avgFillPrice
             # 卖出收入为正，买入支出为负
@@ -774,9 +973,9 @@ async def close_all_positions(ib: IB):
             else:
                 pnl = -fill_price * 100 * qty
             total_pnl += pnl
-            logger.info(f"    ✅ 成交 @ ${fill_price:.2f}, 盈亏: ${pnl:+.2f}")
+            logger.info(f"    ✅ {contract.right} ${contract.strike} 成交 @ ${fill_price:.2f}, 盈亏: ${pnl:+.2f}")
         else:
-            logger.error(f"    ❌ 未成交: {trade.orderStatus.status}")
+            logger.error(f"    ❌ {contract.right} ${contract.strike} 未成交: {trade.orderStatus.status}")
     
     print("\n" + "=" * 50)
     print(f"✅ 平仓完成! 总金额: ${total_pnl:+.2f}")
@@ -805,42 +1004,17 @@ async def run_daily_check(ib: IB):
     
     if local_position:
         # 2. 验证 IBKR 中是否仍持有对应合约的4条腿
-        positions = ib.positions()
-        opts = [p for p in positions if p.contract.symbol == SYMBOL and p.contract.secType == "OPT"]
+        missing_legs = find_missing_legs(local_position)
         
-        # 检查本地记录的四个腿是否在 IBKR 中存在
-        has_short_call = any(
-            p.contract.strike == local_position.short_call_strike and 
-            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-            p.contract.right == "C" and p.position < 0
-            for p in opts
-        )
-        has_long_call = any(
-            p.contract.strike == local_position.long_call_strike and 
-            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-            p.contract.right == "C" and p.position > 0
-            for p in opts
-        )
-        has_short_put = any(
-            p.contract.strike == local_position.short_put_strike and 
-            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-            p.contract.right == "P" and p.position < 0
-            for p in opts
-        )
-        has_long_put = any(
-            p.contract.strike == local_position.long_put_strike and 
-            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-            p.contract.right == "P" and p.position > 0
-            for p in opts
-        )
-        
-        if has_short_call and has_long_call and has_short_put and has_long_put:
-            logger.info(f"✅ 从本地状态确认 Iron Condor 仓位:")
-            logger.info(f"   买Put ${local_position.long_put_strike} | 卖Put ${local_position.short_put_strike} | 卖Call ${local_position.short_call_strike} | 买Call ${local_position.long_call_strike}")
-            logger.info(f"   到期日: {local_position.expiry}, 合约数: {local_position.contracts}")
+        if not missing_legs:
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    f"✅ 从本地状态确认 Iron Condor 仓位:\n"
+                    f"   买Put ${local_position.long_put_strike} | 卖Put ${local_position.short_put_strike} | 卖Call ${local_position.short_call_strike} | 买Call ${local_position.long_call_strike}\n"
+                    f"   到期日: {local_position.expiry}, 合约数: {local_position.contracts}")
             position = local_position
         else:
-            logger.warning(f"⚠️ 本地记录的 Iron Condor 在 IBKR 中部分或全部不存在 (SC={has_short_call}, LC={has_long_call}, SP={has_short_put}, LP={has_long_put})，清除本地记录")
+            logger.warning(f"⚠️ 本地记录的 Iron Condor 在 IBKR 中部分或全部不存在 (缺少: {', '.join(missing_legs)})，清除本地记录")
             clear_position()
             position = None
     else:
@@ -850,8 +1024,7 @@ async def run_daily_check(ib: IB):
     if position is None:
         # 无仓位，建立新仓
         print(f"\n📭 无现有仓位，建立新 Iron Condor ({NUM_CONTRACTS} 张)...")
-        position = await build_iron_condor(ib, stock, current_price)
-        save_position(position)
+        position = await run_to_completion(open_position(ib, stock, current_price))
         print(f"✅ 已建立 Iron Condor 仓位")
         print(
             f"   盈利区间: ${position.short_put_strike:.0f} ~ ${position.short_call_strike:.0f}")
@@ -877,12 +1050,15 @@ async def run_daily_check(ib: IB):
             original_contracts = NUM_CONTRACTS
             globals()['NUM_CONTRACTS'] = add_contracts
             
-            try:
+            async def add_and_save():
                 add_position = await build_iron_condor(ib, stock, current_price)
                 # 更新总持仓信息
                 position.contracts = original_contracts
                 position.initial_credit += add_position.initial_credit
                 save_position(position)
+
+            try:
+                await run_to_completion(add_and_save())
                 print(f"✅ 加仓成功！现在共 {position.contracts} 张")
                 print(f"   总初始权利金: ${position.initial_credit:.2f}")
             finally:
@@ -893,7 +1069,7 @@ async def run_daily_check(ib: IB):
             close_contracts = current_contracts - NUM_CONTRACTS
             print(f"\n📉 检测到现有 {current_contracts} 张，需要减仓 {close_contracts} 张到 {NUM_CONTRACTS} 张...")
             
-            try:
+            async def reduce_and_save() -> float:
                 close_pnl = await close_iron_condor(ib, stock, position, close_contracts)
                 # 更新持仓信息
                 position.contracts = NUM_CONTRACTS
@@ -902,6 +1078,10 @@ async def run_daily_check(ib: IB):
                 position.initial_credit -= credit_per_contract * close_contracts
                 # 减仓的盈亏 = 平仓获得的权利金
                 save_position(position)
+                return close_pnl
+
+            try:
+                close_pnl = await run_to_completion(reduce_and_save())
                 print(f"✅ 减仓成功！现在共 {position.contracts} 张")
                 print(f"   平仓盈亏: ${close_pnl:.2f}")
                 print(f"   剩余初始权利金: ${position.initial_credit:.2f}")
@@ -923,12 +1103,13 @@ async def run_daily_check(ib: IB):
             pnl = position.initial_credit - position.current_value
             pnl_pct = pnl / position.initial_credit if position.initial_credit != 0 else 0
 
-            # 决定调仓动作
-            action, reason = decide_adjustment(position, current_price, pnl_pct)
+            # 决定调仓动作（同一次检查共用一个日期）
+            today = date.today()
+            action, reason = decide_adjustment(position, current_price, pnl_pct, today)
 
             # 打印报告
             print_daily_report(position, current_price,
-                               pnl, pnl_pct, action, reason)
+                               pnl, pnl_pct, action, reason, today)
 
             # 执行动作（如果需要）
             if action != "hold":
@@ -949,10 +1130,10 @@ async def run_continuous(ib: IB):
     position = load_position()
     if position is None:
         price = await get_stock_price(ib, stock)
-        position = await build_iron_condor(ib, stock, price)
-        save_position(position)
+        position = await run_to_completion(open_position(ib, stock, price))
 
     check_count = 0
+    closed = False
     try:
         while True:
             await asyncio.sleep(CHECK_INTERVAL_SEC)
@@ -964,8 +1145,8 @@ async def run_continuous(ib: IB):
             pnl = position.initial_credit - position.current_value
             pnl_pct = pnl / position.initial_credit if position.initial_credit else 0
 
-            logger.info(
-                f"检查 #{check_count} | 价格: ${current_price:.2f} | P&L: {pnl_pct:+.1%}")
+            logger.info("检查 #%d | 价格: $%.2f | P&L: %+.1f%%",
+                        check_count, current_price, pnl_pct * 100)
 
             action, reason = decide_adjustment(
                 position, current_price, pnl_pct)
@@ -973,23 +1154,46 @@ async def run_continuous(ib: IB):
                 print(f"\n⚠️ 触发调仓: {action} - {reason}")
                 if action in ["take_profit", "stop_loss"]:
                     await execute_action(ib, stock, position, action, current_price)
+                    closed = True
                     break
-
-    except KeyboardInterrupt:
-        print("\n👋 用户中断")
+    finally:
+        # 被 SIGTERM/SIGINT 取消时也保存最新状态
+        if not closed:
+            save_position(position)
 
 
 async def main():
     import signal
 
+    # cron 超时发送 SIGTERM 时取消当前任务，让 finally 块保存状态后再断开
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows 事件循环不支持 add_signal_handler
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(stop.set))
+
     ib = await connect_ib()
     try:
         if RUN_MODE == "daily":
-            await run_daily_check(ib)
+            task = asyncio.create_task(run_daily_check(ib))
         elif RUN_MODE == "close_all":
-            await close_all_positions(ib)
+            task = asyncio.create_task(close_all_positions(ib))
         else:
-            await run_continuous(ib)
+            task = asyncio.create_task(run_continuous(ib))
+
+        stop_task = asyncio.create_task(stop.wait())
+        await asyncio.wait([task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+        stop_task.cancel()
+        if not task.done():
+            logger.warning("收到终止信号，保存状态并退出...")
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
     finally:
         ib.disconnect()
 
@@ -1001,4 +1205,4 @@ if __name__ == "__main__":
    标的: {SYMBOL}
    模拟: {SIMULATION_MODE}
 """)
-    asyncio.run(main())
+    run(main())
@@ -91,17 +91,22 @@ QQQ       | <15%  | 15-22% | >30%
 ================================================================================
 """
 import asyncio
+import bisect
 import os
 import math
-import json
 import logging
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from typing import Optional, List, Dict, Tuple
 from dataclasses import dataclass, field, asdict
-from collections import deque
+from functools import lru_cache
+from collections import defaultdict, deque
 
+import numpy as np
 from ib_async import IB, Stock, Option, MarketOrder, LimitOrder
 
+from state_store import StateStore, DB_FILE, dumps, loads
+from market_data import wait_for_ticker, has_price, wait_for_done
+
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -124,6 +129,9 @@ IV_LOOKBACK_DAYS = int(os.getenv("VOL_LOOKBACK", "20"))     # 历史波动率回
 NUM_CONTRACTS = int(os.getenv("VOL_CONTRACTS", "1"))
 STOP_LOSS_PCT = float(os.getenv("VOL_STOP_LOSS", "0.30"))
 CHECK_INTERVAL_SEC = int(os.getenv("VOL_CHECK_INTERVAL", "60"))
+# 自适应检查间隔：空仓时 IV 每远离最近阈值 2%，间隔放大 1 倍，最多放大到 N 倍
+IV_DISTANCE_STEP = 0.02
+MAX_INTERVAL_MULT = float(os.getenv("VOL_MAX_INTERVAL_MULT", "30"))
 FALLBACK_PRICE = float(os.getenv("VOL_FALLBACK_PRICE", "280"))
 
 # 运行模式: daily = 单次检查, continuous = 持续监控, close_all = 一键平仓
@@ -134,10 +142,20 @@ SIMULATION_MODE = os.getenv("VOL_SIMULATION", "false").lower() == "true"
 
 # 状态文件
 STATE_DIR = os.path.join(os.path.dirname(__file__), ".states")
-STATE_FILE = os.path.join(STATE_DIR, f"vol_strategy_{SYMBOL.lower()}.json")
+# 仓位存储（SQLite WAL，见 state_store.py）
+position_store = StateStore("vol_strategy", SYMBOL)
+# 行情状态 WAL / checkpoint：同日重启时免去历史数据拉取
+WAL_FILE = os.path.join(STATE_DIR, f"vol_wal_{SYMBOL.lower()}.jsonl")
+CKPT_FILE = os.path.join(STATE_DIR, f"vol_ckpt_{SYMBOL.lower()}.json")
+CHECKPOINT_EVERY = int(os.getenv("VOL_CHECKPOINT_EVERY", "30"))  # 每 N 轮写一次 checkpoint
+
+# 期权链缓存: symbol -> (日期, chain, 未到期日, 行权价)
+_chain_cache: Dict[str, Tuple[str, object, List[str], np.ndarray]] = {}
+# 已 qualify 的期权合约: (symbol, expiry, strike, right) -> Option（带 conId，无需再次 qualify）
+_option_cache: Dict[Tuple[str, str, float, str], Option] = {}
 
 
-@dataclass
+@dataclass(slots=True)
 class VolatilityPosition:
     """波动率策略持仓 (Straddle/Strangle)"""
     symbol: str
@@ -157,55 +175,198 @@ class VolatilityPosition:
     def from_dict(cls, data: Dict) -> 'VolatilityPosition':
         return cls(**data)
 
-    def get_days_to_expiry(self) -> int:
+    def get_days_to_expiry(self, today: Optional[date] = None) -> int:
         if not self.expiry:
             return 999
         try:
-            return (datetime.strptime(self.expiry, "%Y%m%d").date() - datetime.now().date()).days
-        except:
+            return (datetime.strptime(self.expiry, "%Y%m%d").date() - (today or date.today())).days
+        except (ValueError, TypeError):
             return 999
 
 
-@dataclass
+class RollingVolatility:
+    """
+    滚动历史波动率 (年化)
+
+    保存最近 days 个对数收益率，每加入一个新收盘价从窗口两遍重算均值和方差
+    （days 个元素、每日一次，开销可忽略），不用累计和/平方和相减，长时间运行
+    也不会因抵消误差漂移或出现负方差。结果等于样本标准差 × sqrt(252)。
+    """
+
+    def __init__(self, days: int):
+        self.days = days
+        self.returns: deque = deque(maxlen=days)
+        self.last_price = 0.0
+        self.hv = 0.25  # 窗口未满时的默认值
+
+    def push(self, price: float):
+        if self.last_price > 0 and price > 0:
+            self.returns.append(math.log(price / self.last_price))
+            n = len(self.returns)
+            if n >= self.days and n >= 2:
+                mean = sum(self.returns) / n
+                variance = sum((r - mean) ** 2 for r in self.returns) / (n - 1)
+                self.hv = math.sqrt(max(variance, 0.0) * 252)
+        self.last_price = price
+
+    def value(self) -> float:
+        return self.hv
+
+
+class PriceRing:
+    """
+    定长价格环形缓冲区（numpy 预分配）
+
+    append 不分配内存；tail 在未回绕时返回零拷贝视图。
+    """
+
+    def __init__(self, capacity: int = 128):
+        self.buf = np.empty(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.write_idx = 0
+        self.count = 0
+
+    def append(self, price: float):
+        self.buf[self.write_idx] = price
+        self.write_idx = (self.write_idx + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def extend(self, prices: List[float]):
+        for price in prices:
+            self.append(price)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def tail(self, n: int) -> np.ndarray:
+        """按时间顺序返回最近 n 个价格"""
+        n = min(n, self.count)
+        start = self.write_idx - n
+        if start >= 0:
+            return self.buf[start:self.write_idx]
+        return np.concatenate((self.buf[start:], self.buf[:self.write_idx]))
+
+
+@dataclass(slots=True)
 class StrategyState:
     position: Optional[VolatilityPosition] = None
     hv_20d: float = 0.0
     current_iv: float = 0.0
     current_price: float = 0.0
-    price_history: List[float] = field(default_factory=list)
+    price_history: PriceRing = field(default_factory=lambda: PriceRing(IV_LOOKBACK_DAYS + 30))
+    hv_tracker: RollingVolatility = field(default_factory=lambda: RollingVolatility(IV_LOOKBACK_DAYS))
+    price_date: str = ""  # current_price 所属日期，跨日时把上一日价格计入 HV
+    last_report_key: Optional[Tuple] = None  # 上次报告的 (IV 档位, 持仓数量, 盈亏档位)
+
+
+def roll_day(state: StrategyState, day: str):
+    """
+    跨日：以上一交易日最后价格近似收盘价，增量更新 HV
+
+    周末无新收盘价时跳过；没取到真实股价（仍是 0 或 get_stock_price 的 FALLBACK_PRICE 占位值）
+    时也跳过，占位价不能进入 HV 窗口
+    """
+    if state.price_date and state.price_date != day:
+        has_close = 0 < state.current_price != FALLBACK_PRICE
+        if has_close and datetime.strptime(state.price_date, "%Y%m%d").weekday() < 5:
+            state.price_history.append(state.current_price)
+            state.hv_tracker.push(state.current_price)
+            state.hv_20d = state.hv_tracker.value()
+    state.price_date = day
+
+
+class StateJournal:
+    """
+    行情状态预写日志 (WAL)
+
+    持续模式下行情状态变化时追加一行 {t, d, p, iv} 到 JSONL；每 CHECKPOINT_EVERY 条把
+    收盘价序列和当前价写入 checkpoint 并截断 WAL。重启时加载 checkpoint 再重放 WAL。
+    """
+
+    def __init__(self, wal_path: str, ckpt_path: str, every: int):
+        self.wal_path = wal_path
+        self.ckpt_path = ckpt_path
+        self.every = max(every, 1)
+        self.ticks = 0
+        self.last_rec: Optional[Tuple[str, float, float]] = None  # 上次记录的 (d, p, iv)
+
+    def restore(self, state: StrategyState) -> bool:
+        """恢复到 state；返回是否已有当日状态且收盘价足够计算 HV"""
+        try:
+            with open(self.ckpt_path, 'r') as f:
+                ckpt = loads(f.read())
+        except (OSError, ValueError):
+            return False
+        
+        closes = ckpt.get('closes', [])
+        state.price_history.extend(closes)
+        for p in closes:
+            state.hv_tracker.push(p)
+        state.hv_20d = state.hv_tracker.value()
+        state.price_date = ckpt.get('d', "")
+        state.current_price = ckpt.get('p', 0.0)
+        
+        try:
+            with open(self.wal_path, 'r') as f:
+                for line in f:
+                    try:
+                        rec = loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了一半的尾行
+                    roll_day(state, rec['d'])
+                    state.current_price = rec['p']
+                    state.current_iv = rec['iv']
+        except OSError:
+            pass
+        
+        today = datetime.now().strftime("%Y%m%d")
+        return state.price_date == today and len(state.price_history) > IV_LOOKBACK_DAYS
+
+    def record(self, state: StrategyState, now: Optional[datetime] = None):
+        """追加一条记录（与上次记录相同时跳过），满 every 条后写 checkpoint"""
+        key = (state.price_date, state.current_price, state.current_iv)
+        if key == self.last_rec:
+            return
+        self.last_rec = key
+        rec = {'t': (now or datetime.now()).isoformat(timespec='seconds'), 'd': state.price_date,
+               'p': state.current_price, 'iv': state.current_iv}
+        with open(self.wal_path, 'a') as f:
+            f.write(dumps(rec) + '\n')
+        self.ticks += 1
+        if self.ticks >= self.every:
+            self.checkpoint(state)
+
+    def checkpoint(self, state: StrategyState):
+        """写入完整状态（先写临时文件再替换），然后截断 WAL"""
+        ckpt = {'closes': state.price_history.tail(len(state.price_history)).tolist(),
+                'd': state.price_date, 'p': state.current_price}
+        tmp = self.ckpt_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(dumps(ckpt))
+        os.replace(tmp, self.ckpt_path)
+        open(self.wal_path, 'w').close()
+        self.ticks = 0
 
 
 def load_local_position() -> Optional[VolatilityPosition]:
-    """从文件加载仓位"""
-    os.makedirs(STATE_DIR, exist_ok=True)
-    if not os.path.exists(STATE_FILE):
-        return None
+    """从仓位存储加载仓位"""
     try:
-        with open(STATE_FILE, 'r') as f:
-            data = json.load(f)
-            return VolatilityPosition.from_dict(data['position'])
+        data = position_store.load()
+        return VolatilityPosition.from_dict(data) if data else None
     except Exception as e:
         logger.error(f"加载仓位失败: {e}")
         return None
 
 
 def save_position(position: VolatilityPosition):
-    """保存仓位到文件"""
-    os.makedirs(STATE_DIR, exist_ok=True)
-    data = {
-        'position': position.to_dict(),
-        'last_updated': datetime.now().isoformat(),
-        'symbol': SYMBOL
-    }
-    with open(STATE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-    logger.info(f"仓位已保存: {STATE_FILE}")
+    """保存仓位，单行 INSERT OR REPLACE"""
+    position_store.save(position.to_dict())
+    logger.info(f"仓位已保存: {DB_FILE} ({position_store.strategy_name}/{position_store.symbol})")
 
 
 def clear_position():
-    """清除仓位文件"""
-    if os.path.exists(STATE_FILE):
-        os.remove(STATE_FILE)
+    """清除仓位"""
+    if position_store.clear():
         logger.info("仓位已清除")
 
 
@@ -216,9 +377,14 @@ async def connect_ib() -> IB:
     return ib
 
 
+def has_price_and_iv(ticker) -> bool:
+    greeks = ticker.modelGreeks or ticker.lastGreeks
+    return bool(greeks and greeks.impliedVol) and (has_price(ticker) or ticker.bid > 0)
+
+
 async def get_stock_price(ib: IB, stock: Stock) -> float:
     ticker = ib.reqMktData(stock, "", False, False)
-    await asyncio.sleep(2)
+    await wait_for_ticker(ticker, has_price)
     price = ticker.last or ticker.close or FALLBACK_PRICE
     ib.cancelMktData(stock)
     return price if price and not math.isnan(price) else FALLBACK_PRICE
@@ -244,31 +410,19 @@ async def cancel_all_option_orders(ib: IB, symbol: str):
 
 async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[VolatilityPosition]:
     """从 IBKR 查询真实持仓，检测是否存在 Straddle/Strangle"""
-    positions = ib.positions()
-    option_positions = [
-        p for p in positions 
-        if p.contract.symbol == symbol and p.contract.secType == "OPT"
-    ]
-    
-    if not option_positions:
-        return None
-        
-    # 按到期日分组
-    from collections import defaultdict
-    expiry_groups = defaultdict(list)
-    for p in option_positions:
-        expiry_groups[p.contract.lastTradeDateOrContractMonth].append(p)
+    # 单次遍历：按 (到期日, C/P) 分组，每组只保留第一个持仓
+    expiry_groups: Dict[str, Dict[str, object]] = defaultdict(dict)
+    for p in ib.positions():
+        if p.contract.symbol == symbol and p.contract.secType == "OPT":
+            expiry_groups[p.contract.lastTradeDateOrContractMonth].setdefault(p.contract.right, p)
         
     # 寻找匹配的 Call/Put 对
     # 这里的简化逻辑：找同一到期日，数量相等且方向相同的 Call 和 Put
-    for expiry, pos_list in expiry_groups.items():
-        calls = [p for p in pos_list if p.contract.right == 'C']
-        puts = [p for p in pos_list if p.contract.right == 'P']
-        
-        if calls and puts:
+    for expiry, legs in expiry_groups.items():
+        if 'C' in legs and 'P' in legs:
             # 简单匹配第一个对子
-            call_pos = calls[0]
-            put_pos = puts[0]
+            call_pos = legs['C']
+            put_pos = legs['P']
             
             # 检查数量是否匹配 (符号相同表示同向) 且行权价相同（真正的 Straddle）
             if call_pos.position == put_pos.position and call_pos.contract.strike == put_pos.contract.strike:
@@ -302,64 +456,120 @@ async def get_historical_prices(ib: IB, stock: Stock, days: int = 30) -> List[fl
             barSizeSetting="1 day", whatToShow="TRADES",
             useRTH=True, formatDate=1
         )
-        return [bar.close for bar in bars] if bars else []
-    except:
+        if not bars:
+            return []
+        # 盘中请求时最后一根是今天未收盘的日线；今天的收盘价由跨日时的 roll_day 计入，
+        # 这里丢掉，避免同一天在滚动 HV 中被算两次
+        last_day = bars[-1].date
+        if isinstance(last_day, datetime):
+            last_day = last_day.date()
+        if last_day == date.today():
+            bars = bars[:-1]
+        return [bar.close for bar in bars]
+    except Exception as e:
+        logger.warning(f"获取历史数据失败: {e}")
         return []
 
 
-def calculate_historical_volatility(prices: List[float], days: int = 20) -> float:
-    """计算历史波动率 (年化)"""
-    if len(prices) < days + 1:
-        return 0.25
-    returns = []
-    for i in range(1, min(days + 1, len(prices))):
-        ret = math.log(prices[-i] / prices[-i-1])
-        returns.append(ret)
-    if len(returns) < 2:
-        return 0.25
-    mean_ret = sum(returns) / len(returns)
-    variance = sum((r - mean_ret) ** 2 for r in returns) / (len(returns) - 1)
-    return math.sqrt(variance) * math.sqrt(252)
+@lru_cache(maxsize=1024)
+def option_mark(last: float, close: float, bid: float, ask: float,
+                model_iv: float, last_iv: float) -> Tuple[float, float]:
+    """由原始行情字段算出 (价格, IV)，纯函数；延迟行情下输入常重复，直接命中缓存"""
+    price = last or close or ((bid or 0) + (ask or 0)) / 2
+    iv = model_iv or last_iv or 0.0
+    return price, iv
+
+
+def read_greeks(ticker) -> Tuple[float, float]:
+    """从 ticker 读取期权价格和 IV"""
+    model_iv = ticker.modelGreeks.impliedVol if ticker.modelGreeks else None
+    last_iv = ticker.lastGreeks.impliedVol if ticker.lastGreeks else None
+    return option_mark(ticker.last, ticker.close, ticker.bid, ticker.ask, model_iv, last_iv)
+
+
+async def get_options_greeks(ib: IB, options: List[Option]) -> List[Tuple[float, float]]:
+    """同时订阅多个期权，共用一个等待窗口，返回 [(价格, IV), ...]"""
+    # options 应该是已经 qualify 过的，所以直接 reqMktData
+    tickers = [ib.reqMktData(option, "106", False, False) for option in options]
+    await asyncio.gather(*(wait_for_ticker(ticker, has_price_and_iv) for ticker in tickers))
+    
+    results = [read_greeks(ticker) for ticker in tickers]
+    for option in options:
+        ib.cancelMktData(option)
+    return results
 
 
 async def get_option_greeks(ib: IB, option: Option) -> Tuple[float, float]:
     """获取期权价格和 IV"""
-    # 重新 qualifiy 确保 conId 正确
-    # options 应该是已经 qualify 过的，所以直接 reqMktData
-    ticker = ib.reqMktData(option, "106", False, False)
-    await asyncio.sleep(2)
+    return (await get_options_greeks(ib, [option]))[0]
+
+
+async def load_chain_entry(ib: IB, stock: Stock) -> Optional[Tuple]:
+    """
+    获取 SMART 期权链参数（当日内缓存）
+
+    返回 (日期, chain, 未到期日(已排序), 行权价(已排序的 ndarray))，过滤和排序每天只做一次
+    """
+    today = datetime.now().strftime("%Y%m%d")
+    cached = _chain_cache.get(stock.symbol)
+    if cached and cached[0] == today:
+        return cached
     
-    price = ticker.last or ticker.close or ((ticker.bid or 0) + (ticker.ask or 0)) / 2
-    iv = 0.0
-    if ticker.modelGreeks and ticker.modelGreeks.impliedVol:
-        iv = ticker.modelGreeks.impliedVol
-    elif ticker.lastGreeks and ticker.lastGreeks.impliedVol:
-        iv = ticker.lastGreeks.impliedVol
-        
-    ib.cancelMktData(option)
-    return price, iv
+    chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
+    if not chains:
+        return None
+    chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
+    entry = (today, chain, sorted(e for e in chain.expirations if e > today),
+             np.array(sorted(chain.strikes), dtype=np.float64))
+    _chain_cache[stock.symbol] = entry
+    return entry
+
+
+async def qualify_options(ib: IB, specs: List[Tuple[str, str, float, str]]) -> List[Option]:
+    """按 (标的, 到期日, 行权价, C/P) 返回期权合约；已缓存的直接复用，其余一次批量 qualify"""
+    fresh = {spec: Option(*spec, "SMART") for spec in specs if spec not in _option_cache}
+    if fresh:
+        await ib.qualifyContractsAsync(*fresh.values())
+        for spec, opt in fresh.items():
+            if opt.conId:
+                _option_cache[spec] = opt
+    return [_option_cache.get(spec) or fresh[spec] for spec in specs]
+
+
+def remember_option(opt: Option):
+    """记录已带 conId 的合约（如 reqContractDetails 返回的），后续无需再 qualify"""
+    _option_cache[(opt.symbol, opt.lastTradeDateOrContractMonth, opt.strike, opt.right)] = opt
+
+
+async def find_atm_option(ib: IB, stock: Stock, price: float) -> Optional[Option]:
+    """找下个到期日的 ATM Call（用于估算当前 IV），ATM 行权价不变时复用已确认的合约"""
+    entry = await load_chain_entry(ib, stock)
+    if not entry:
+        return None
+    _, _, valid_exp, strikes = entry
+    # 找下个月的
+    if not valid_exp:
+        return None
+    exp = valid_exp[1] if len(valid_exp) > 1 else valid_exp[0]
+    strike = float(strikes[np.abs(strikes - price).argmin()])
+    
+    return (await qualify_options(ib, [(stock.symbol, exp, strike, "C")]))[0]
 
 
 async def open_straddle(ib: IB, stock: Stock, direction: str, price: float) -> Optional[VolatilityPosition]:
     """开仓 Straddle (同Strike)"""
     logger.info(f"📦 正在开仓 Straddle ({direction})...")
     
-    # 获取期权链参数
-    chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
-    if not chains:
+    # 获取期权链参数（未到期日已在缓存中排序）
+    entry = await load_chain_entry(ib, stock)
+    if not entry:
         logger.error("无法获取期权链参数")
         return None
-        
-    chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
-    
-    # 过滤出未来的到期日
-    import datetime as dt
-    target_date = (datetime.now() + dt.timedelta(days=30)).strftime("%Y%m%d")
+    future_exp = entry[2]
     
     # 优先找30天后的，如果没有则找最近的
-    valid_expirations = sorted([e for e in chain.expirations if e > target_date])
-    if not valid_expirations:
-        valid_expirations = sorted([e for e in chain.expirations if e > datetime.now().strftime("%Y%m%d")])
+    target_date = (datetime.now() + timedelta(days=30)).strftime("%Y%m%d")
+    valid_expirations = future_exp[bisect.bisect_right(future_exp, target_date):] or future_exp
     
     if not valid_expirations:
         logger.error("无可用到期日")
@@ -384,25 +594,34 @@ async def open_straddle(ib: IB, stock: Stock, direction: str, price: float) -> O
         if not details:
             continue
 
+        # reqContractDetails 返回的合约已带 conId，选中后无需再 qualify
         valid_contracts = [d.contract for d in details]
         
-        # 分离 Call 和 Put
-        calls = [c for c in valid_contracts if c.right == 'C']
-        puts = [c for c in valid_contracts if c.right == 'P']
+        # 分离 Call 和 Put（Put 按行权价建索引，同一行权价保留第一个）
+        calls = []
+        puts_by_strike = {}
+        for c in valid_contracts:
+            if c.right == 'C':
+                calls.append(c)
+            elif c.right == 'P':
+                puts_by_strike.setdefault(c.strike, c)
         
-        if not calls or not puts:
+        if not calls or not puts_by_strike:
             continue
             
         # 找 ATM Call
-        best_call = min(calls, key=lambda c: abs(c.strike - price))
+        call_strikes = np.fromiter((c.strike for c in calls), dtype=np.float64, count=len(calls))
+        best_call = calls[int(np.abs(call_strikes - price).argmin())]
         strike_candidate = best_call.strike
         
         # 找对应的 Put
-        best_put = next((p for p in puts if p.strike == strike_candidate), None)
+        best_put = puts_by_strike.get(strike_candidate)
         
         if best_call and best_put:
             call = best_call
             put = best_put
+            remember_option(call)
+            remember_option(put)
             expiry = exp
             strike = strike_candidate
             break
@@ -412,8 +631,7 @@ async def open_straddle(ib: IB, stock: Stock, direction: str, price: float) -> O
         return None
 
     # 获取数据
-    call_p, call_iv = await get_option_greeks(ib, call)
-    put_p, put_iv = await get_option_greeks(ib, put)
+    (call_p, call_iv), (put_p, put_iv) = await get_options_greeks(ib, [call, put])
     avg_iv = (call_iv + put_iv) / 2
     
     total_cost = (call_p + put_p) * 100 * NUM_CONTRACTS
@@ -431,12 +649,8 @@ async def open_straddle(ib: IB, stock: Stock, direction: str, price: float) -> O
         c_trade = ib.placeOrder(call, c_order)
         p_trade = ib.placeOrder(put, p_order)
         
-        # 简单的等待逻辑
-        MAX_WAIT = 10
-        for _ in range(MAX_WAIT):
-            if c_trade.isDone() and p_trade.isDone():
-                break
-            await asyncio.sleep(1)
+        # 两腿同时等待，最多 10 秒
+        await asyncio.gather(wait_for_done(c_trade, 10), wait_for_done(p_trade, 10))
             
         logger.info(f"✅ 订单提交完成: {action} Straddle")
         
@@ -463,11 +677,11 @@ async def close_position(ib: IB, stock: Stock, position: VolatilityPosition, rea
         clear_position()
         return
 
-    # 构造合约
-    call = Option(position.symbol, position.expiry, position.strike_call, "C", "SMART")
-    put = Option(position.symbol, position.expiry, position.strike_put, "P", "SMART")
-    await ib.qualifyContractsAsync(call)
-    await ib.qualifyContractsAsync(put)
+    # 构造合约（已 qualify 过的直接复用）
+    call, put = await qualify_options(ib, [
+        (position.symbol, position.expiry, position.strike_call, "C"),
+        (position.symbol, position.expiry, position.strike_put, "P"),
+    ])
     
     qty = abs(position.contracts)
     # 平仓方向与持仓方向相反
@@ -479,8 +693,7 @@ async def close_position(ib: IB, stock: Stock, position: VolatilityPosition, rea
     c_trade = ib.placeOrder(call, c_order)
     p_trade = ib.placeOrder(put, p_order)
     
-    while not (c_trade.isDone() and p_trade.isDone()):
-        await asyncio.sleep(1)
+    await asyncio.gather(wait_for_done(c_trade), wait_for_done(p_trade))
         
     logger.info("✅ 平仓完成")
     clear_position()
@@ -500,40 +713,63 @@ async def close_all_positions(ib: IB):
         clear_position()
 
 
-def print_status_report(state: StrategyState, action: str, reason: str):
-    """打印状态报告"""
+def next_check_interval(state: StrategyState) -> float:
+    """下次检查前的等待秒数：持仓时按基础间隔；空仓时 IV 离开仓阈值越远，间隔越长"""
+    if state.position or state.current_iv <= 0:
+        # 持仓中，或本轮 IV 获取失败（为 0）时不拉长间隔，尽快重试
+        return CHECK_INTERVAL_SEC
+    distance = min(abs(state.current_iv - IV_HIGH_THRESHOLD), abs(state.current_iv - IV_LOW_THRESHOLD))
+    return CHECK_INTERVAL_SEC * min(max(distance / IV_DISTANCE_STEP, 1.0), MAX_INTERVAL_MULT)
+
+
+# IV 计量条字形表：40 格实心 + 40 格空心，按填充格数切片即得计量条
+IV_BAR_LEN = 40
+_IV_BAR = "█" * IV_BAR_LEN + "░" * IV_BAR_LEN
+
+
+def calc_pnl(pos: VolatilityPosition, entry_price: float) -> Tuple[float, float]:
+    """浮动盈亏 (金额, 比例)：Long = 当前价值 - 成本，Short = 成本 - 当前价值"""
+    cost = entry_price * abs(pos.contracts) * 100
+    sign = -1 if pos.contracts < 0 else 1
+    pnl = sign * (pos.current_value - cost)
+    return pnl, (pnl / cost if cost > 0 else 0.0)
+
+
+def print_status_report(state: StrategyState, action: str, reason: str, now: Optional[datetime] = None):
+    """打印状态报告（now 为本轮检查时间，默认取当前时间）"""
+    now = now or datetime.now()
     pos = state.position
     hv = state.hv_20d
     iv = state.current_iv
+    lines = []  # 先收集，最后一次性输出
     
-    print("\n" + "=" * 60)
-    print(f"📊 波动率策略状态报告 - {SYMBOL}")
-    print(f"⏰ 时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("=" * 60)
+    lines.append("\n" + "=" * 60)
+    lines.append(f"📊 波动率策略状态报告 - {SYMBOL}")
+    lines.append(f"⏰ 时间: {now.strftime('%Y-%m-%d %H:%M:%S')}")
+    lines.append("=" * 60)
     
-    print(f"\n【市场状态】")
-    print(f"  当前价格: ${state.current_price:.2f}")
-    print(f"  历史波动率 (HV20): {hv:.1%}")
-    print(f"  隐含波动率 (IV):   {iv:.1%}")
+    lines.append(f"\n【市场状态】")
+    lines.append(f"  当前价格: ${state.current_price:.2f}")
+    lines.append(f"  历史波动率 (HV20): {hv:.1%}")
+    lines.append(f"  隐含波动率 (IV):   {iv:.1%}")
     if hv > 0:
-        print(f"  IV/HV 比率: {iv/hv:.2f}x")
+        lines.append(f"  IV/HV 比率: {iv/hv:.2f}x")
     
     # 简单的 IV 计量条
-    bar_len = 40
     iv_ratio = min(iv / 0.60, 1.0) # 假设 60% IV 满格
-    filled = int(iv_ratio * bar_len)
-    bar = "█" * filled + "░" * (bar_len - filled)
-    print(f"  [{bar}]")
-    print(f"  Low: {IV_LOW_THRESHOLD:.0%} | High: {IV_HIGH_THRESHOLD:.0%}")
+    filled = int(iv_ratio * IV_BAR_LEN)
+    bar = _IV_BAR[IV_BAR_LEN - filled:2 * IV_BAR_LEN - filled]
+    lines.append(f"  [{bar}]")
+    lines.append(f"  Low: {IV_LOW_THRESHOLD:.0%} | High: {IV_HIGH_THRESHOLD:.0%}")
     
     if pos:
-        print(f"\n【持仓详情】")
+        lines.append(f"\n【持仓详情】")
         type_str = "Short Straddle (做空波动率)" if pos.contracts < 0 else "Long Straddle (做多波动率)"
-        print(f"  类型: {type_str}")
-        print(f"  数量: {abs(pos.contracts)} 张")
-        print(f"  行权: Call ${pos.strike_call} / Put ${pos.strike_put}")
-        print(f"  到期: {pos.expiry} ({pos.get_days_to_expiry()}天)")
-        print(f"  建仓 IV: {pos.entry_iv:.1%}")
+        lines.append(f"  类型: {type_str}")
+        lines.append(f"  数量: {abs(pos.contracts)} 张")
+        lines.append(f"  行权: Call ${pos.strike_call} / Put ${pos.strike_put}")
+        lines.append(f"  到期: {pos.expiry} ({pos.get_days_to_expiry(now.date())}天)")
+        lines.append(f"  建仓 IV: {pos.entry_iv:.1%}")
         
         # 估算 PnL
         # 如果 entry_price 为 0，使用当前价值作为成本基础（表示成本信息缺失）
@@ -544,24 +780,17 @@ def print_status_report(state: StrategyState, action: str, reason: str):
             entry_price_display = pos.current_value / (abs(pos.contracts) * 100) if pos.contracts != 0 else 0
             cost_note = " (⚠️ 估算值)"
         
-        pnl = pos.current_value - (entry_price_display * abs(pos.contracts) * 100)
-        # 如果是 Short，PnL = 卖出得钱 - 当前买回花费
-        if pos.contracts < 0:
-            pnl = (entry_price_display * abs(pos.contracts) * 100) - pos.current_value
+        pnl, pnl_pct = calc_pnl(pos, entry_price_display)
             
-        pnl_pct = 0.0
-        cost_basis = entry_price_display * abs(pos.contracts) * 100
-        if cost_basis > 0:
-            pnl_pct = pnl / cost_basis
-            
-        print(f"  建仓成本: ${entry_price_display:.2f}/组合{cost_note}")
-        print(f"  当前价值: ${pos.current_value:.2f}")
-        print(f"  浮动盈亏: ${pnl:+.2f} ({pnl_pct:+.1%})")
+        lines.append(f"  建仓成本: ${entry_price_display:.2f}/组合{cost_note}")
+        lines.append(f"  当前价值: ${pos.current_value:.2f}")
+        lines.append(f"  浮动盈亏: ${pnl:+.2f} ({pnl_pct:+.1%})")
     
-    print(f"\n【决策】")
-    print(f"  👉 动作: {action}")
-    print(f"  📝 原因: {reason}")
-    print("=" * 60)
+    lines.append(f"\n【决策】")
+    lines.append(f"  👉 动作: {action}")
+    lines.append(f"  📝 原因: {reason}")
+    lines.append("=" * 60)
+    print("\n".join(lines))
 
 
 async def run_strategy_check(ib: IB, continuous: bool = False):
@@ -571,18 +800,35 @@ async def run_strategy_check(ib: IB, continuous: bool = False):
     stock = Stock(SYMBOL, EXCHANGE, CURRENCY)
     stock = (await ib.qualifyContractsAsync(stock))[0]
     
-    # 状态初始化
+    # 状态初始化：同日重启时从 checkpoint + WAL 恢复，免去历史数据拉取
+    os.makedirs(STATE_DIR, exist_ok=True)
+    journal = StateJournal(WAL_FILE, CKPT_FILE, CHECKPOINT_EVERY)
     state = StrategyState()
+    if journal.restore(state):
+        logger.info(f"已从 WAL 恢复行情状态 ({len(state.price_history)} 个收盘价)")
+        state.current_price = await get_stock_price(ib, stock)
+    else:
+        # 获取历史数据计算 HV，同时获取当前股价（两者互不依赖）
+        state = StrategyState()
+        hist_prices, state.current_price = await asyncio.gather(
+            get_historical_prices(ib, stock, IV_LOOKBACK_DAYS + 10),
+            get_stock_price(ib, stock),
+        )
+        state.price_date = datetime.now().strftime("%Y%m%d")
+        if hist_prices:
+            state.price_history.extend(hist_prices)
+            for p in hist_prices:
+                state.hv_tracker.push(p)
+            state.hv_20d = state.hv_tracker.value()
+        journal.checkpoint(state)
     
-    # 获取历史数据计算 HV
-    hist_prices = await get_historical_prices(ib, stock, IV_LOOKBACK_DAYS + 10)
-    if hist_prices:
-        state.price_history = hist_prices
-        state.hv_20d = calculate_historical_volatility(hist_prices, IV_LOOKBACK_DAYS)
-    
+    first_check = True
     while True:
-        # 1. 基础数据更新
-        state.current_price = await get_stock_price(ib, stock)
+        # 1. 跨日：日线 HV 在同一天内不会变化，只在出现新的日线收盘时计算一次
+        # 本轮所有日期判断都基于同一个 now
+        now = datetime.now()
+        today = now.strftime("%Y%m%d")
+        roll_day(state, today)
         
         # 2. 修复：优先从本地状态文件识别仓位
         # Straddle 必须是同一行权价的 Call+Put
@@ -631,18 +877,25 @@ async def run_strategy_check(ib: IB, continuous: bool = False):
             # 没有本地记录，尝试从 IBKR 自动检测（只检测真正的 Straddle：同行权价）
             state.position = await load_position_from_ibkr(ib, SYMBOL)
         
-        # 3. 获取 ATM IV
+        # 3. 更新股价并获取 ATM IV（首轮股价已在启动时获取）
         # 为了获取 IV，如果是持仓状态，用持仓的 Option；否则找 ATM
         iv_sample = 0.0
         if state.position:
-            # 更新持仓价值
-            call = Option(state.position.symbol, state.position.expiry, state.position.strike_call, "C", "SMART")
-            put = Option(state.position.symbol, state.position.expiry, state.position.strike_put, "P", "SMART")
-            await ib.qualifyContractsAsync(call)
-            await ib.qualifyContractsAsync(put)
+            # 更新持仓价值（持仓腿在平仓前固定，只在首次出现时 qualify）
+            pos = state.position
+            call, put = await qualify_options(ib, [
+                (pos.symbol, pos.expiry, pos.strike_call, "C"),
+                (pos.symbol, pos.expiry, pos.strike_put, "P"),
+            ])
             
-            cp, civ = await get_option_greeks(ib, call)
-            pp, piv = await get_option_greeks(ib, put)
+            # 股价与两条腿行情互不依赖，在同一等待窗口内获取
+            if first_check:
+                (cp, civ), (pp, piv) = await get_options_greeks(ib, [call, put])
+            else:
+                state.current_price, ((cp, civ), (pp, piv)) = await asyncio.gather(
+                    get_stock_price(ib, stock),
+                    get_options_greeks(ib, [call, put]),
+                )
             iv_sample = (civ + piv) / 2
             
             state.position.current_value = (cp + pp) * 100 * abs(state.position.contracts)
@@ -650,32 +903,34 @@ async def run_strategy_check(ib: IB, continuous: bool = False):
             # 修复：如果 entry_price 为 0，使用当前价格作为成本基础并保存
             if state.position.entry_price == 0 or state.position.entry_price < 0.01:
                 state.position.entry_price = cp + pp  # 组合单价
-                state.position.entry_date = state.position.entry_date or datetime.now().strftime("%Y-%m-%d")
+                state.position.entry_date = state.position.entry_date or now.strftime("%Y-%m-%d")
                 logger.warning(f"⚠️ 缺失 entry_price，使用当前市场价格 ${state.position.entry_price:.2f} 作为成本基础")
                 save_position(state.position)
         else:
-            # 无持仓，找 ATM 估算当前 IV
-            chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
-            if chains:
-                chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
-                # 找下个月的
-                valid_exp = [e for e in chain.expirations if e > datetime.now().strftime("%Y%m%d")]
-                if valid_exp:
-                    exp = valid_exp[1] if len(valid_exp) > 1 else valid_exp[0]
-                    strike = min(chain.strikes, key=lambda x: abs(x - state.current_price))
-                    atm_opt = Option(SYMBOL, exp, strike, "C", "SMART")
-                    await ib.qualifyContractsAsync(atm_opt)
-                    _, iv_sample = await get_option_greeks(ib, atm_opt)
+            # 无持仓，找 ATM 估算当前 IV（ATM 行权价依赖最新股价；期权链不依赖，与股价并发获取）
+            if not first_check:
+                state.current_price, _ = await asyncio.gather(
+                    get_stock_price(ib, stock),
+                    load_chain_entry(ib, stock),
+                )
+            atm_opt = await find_atm_option(ib, stock, state.current_price)
+            if atm_opt:
+                _, iv_sample = await get_option_greeks(ib, atm_opt)
         
         state.current_iv = iv_sample
+        first_check = False
+        if continuous:
+            # 单次模式运行一轮即退出，WAL 没有重放的机会，不必写
+            journal.record(state, now)
         
         # 4. 决策逻辑
         action = "HOLD"
         reason = "观察中"
+        pnl_pct = 0.0
         
         if state.position:
             # 持仓管理
-            days = state.position.get_days_to_expiry()
+            days = state.position.get_days_to_expiry(now.date())
             
             # 计算 PnL Pct
             # 确保 entry_price 有效
@@ -686,12 +941,7 @@ async def run_strategy_check(ib: IB, continuous: bool = False):
                 pnl = 0
                 pnl_pct = 0
             else:
-                cost = entry_price * abs(state.position.contracts) * 100
-                if state.position.contracts < 0: # Short
-                    pnl = cost - state.position.current_value
-                else: # Long
-                    pnl = state.position.current_value - cost
-                pnl_pct = pnl / cost if cost > 0 else 0
+                pnl, pnl_pct = calc_pnl(state.position, entry_price)
             
             entry_iv = state.position.entry_iv
             
@@ -742,13 +992,23 @@ async def run_strategy_check(ib: IB, continuous: bool = False):
                 if new_pos:
                     save_position(new_pos)
 
-        # 5. 报告
-        print_status_report(state, action, reason)
+        # 5. 报告（持续模式下仅在 IV 档位 (2%) / 持仓 / 盈亏档位 (5%) 变化或有动作时打印，
+        #    持仓盈亏一路滑向止损时也会逐档打印）
+        report_key = (int(state.current_iv * 100) // 2,
+                      state.position.contracts if state.position else 0,
+                      int(pnl_pct * 100) // 5)
+        if not continuous or action != "HOLD" or report_key != state.last_report_key:
+            print_status_report(state, action, reason, now)
+            state.last_report_key = report_key
+        else:
+            logger.debug("状态无变化，跳过报告")
         
         if not continuous:
             break
             
-        await asyncio.sleep(CHECK_INTERVAL_SEC)
+        interval = next_check_interval(state)
+        logger.debug(f"下次检查: {interval:.0f}s 后")
+        await asyncio.sleep(interval)
 
 
 async def main():
@@ -43,21 +43,31 @@ BF_MODE=daily uv run demo14_butterfly_spread.py
 # 模式2: 持续监控
 BF_MODE=continuous uv run demo14_butterfly_spread.py
 
+# 模式3: 常驻进程（连接、合约、行情订阅只初始化一次，收到 SIGUSR1 时检查一次）
+BF_MODE=daemon uv run demo14_butterfly_spread.py &
+# cron 只负责发信号，不再每次重连 TWS:
+# 35 9 * * 1-5 kill -USR1 $(cat /path/.states/butterfly_aapl.pid)
+
 ================================================================================
 """
 import asyncio
 import os
-import math
-import json
+import time
 import logging
-from datetime import datetime
-from typing import Optional, List, Dict, Tuple
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Tuple, Any
 from dataclasses import dataclass, field, asdict
 
-from ib_async import IB, Stock, Option, MarketOrder
+import numpy as np
+from ib_async import IB, Stock, Option, MarketOrder, Contract, ComboLeg
+
+from state_store import StateStore, DB_FILE, STATE_DIR
+from runtime import setup_queue_logging, run
+from market_data import TickerPool, has_price, wait_for_done
 
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s - %(levelname)s - %(message)s")
+# 日志经队列交给后台线程写终端，监控循环里的 logger 调用只做入队，不阻塞在 I/O 上
+setup_queue_logging()
 logger = logging.getLogger(__name__)
 
 # ========== 配置 ==========
@@ -82,12 +92,12 @@ RUN_MODE = os.getenv("BF_MODE", "daily")
 USE_DELAYED_DATA = os.getenv("BF_USE_DELAYED", "true").lower() == "true"
 SIMULATION_MODE = os.getenv("BF_SIMULATION", "false").lower() == "true"  # Default false for live
 
-# 状态文件
-STATE_DIR = os.path.join(os.path.dirname(__file__), ".states")
-STATE_FILE = os.path.join(STATE_DIR, f"butterfly_{SYMBOL.lower()}.json")
+# 仓位存储（共用 SQLite 库，首次读取时迁移旧版 .states/butterfly_<symbol>.json）
+position_store = StateStore("butterfly", SYMBOL)
+PID_FILE = os.path.join(STATE_DIR, f"butterfly_{SYMBOL.lower()}.pid")  # daemon 模式
 
 
-@dataclass
+@dataclass(slots=True)
 class ButterflyPosition:
     """Butterfly Spread 仓位"""
     symbol: str
@@ -118,40 +128,46 @@ class ButterflyPosition:
         return self.initial_cost
 
 
-@dataclass
+@dataclass(slots=True)
 class StrategyState:
     position: Optional[ButterflyPosition] = None
     current_price: float = 0.0
+    # 已 qualify 的三条腿 (下翼, 身体, 上翼)，leg_key 对应 (到期日, 三个行权价)
+    leg_options: Optional[Tuple[Option, Option, Option]] = None
+    leg_key: Optional[Tuple[str, float, float, float]] = None
+
+
+# 上次写入的仓位内容，未变化时跳过写入
+_last_saved_position: Optional[Dict] = None
 
 
 def load_local_position() -> Optional[ButterflyPosition]:
-    os.makedirs(STATE_DIR, exist_ok=True)
-    if not os.path.exists(STATE_FILE):
-        return None
+    """从仓位存储加载仓位（库未变化时直接命中 StateStore 缓存）"""
     try:
-        with open(STATE_FILE, 'r') as f:
-            data = json.load(f)
-            return ButterflyPosition.from_dict(data['position'])
+        data = position_store.load()
+        # 每次返回新对象，调用方修改仓位不会污染缓存
+        return ButterflyPosition.from_dict(data) if data else None
     except Exception as e:
         logger.error(f"加载仓位失败: {e}")
         return None
 
 
 def save_position(position: ButterflyPosition):
-    os.makedirs(STATE_DIR, exist_ok=True)
-    data = {
-        'position': position.to_dict(),
-        'last_updated': datetime.now().isoformat(),
-        'symbol': SYMBOL
-    }
-    with open(STATE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-    logger.info(f"仓位已保存: {STATE_FILE}")
+    """保存仓位，单行 INSERT OR REPLACE（事务写入，中途崩溃不会留下半截数据）"""
+    global _last_saved_position
+    position_data = position.to_dict()
+    # 内容未变且库中记录仍在时跳过；记录被清除时照常重写
+    if position_data == _last_saved_position and position_store.load() is not None:
+        return
+    position_store.save(position_data)
+    _last_saved_position = position_data
+    logger.info("仓位已保存: %s (%s/%s)", DB_FILE, position_store.strategy_name, position_store.symbol)
 
 
 def clear_position():
-    if os.path.exists(STATE_FILE):
-        os.remove(STATE_FILE)
+    global _last_saved_position
+    _last_saved_position = None
+    if position_store.clear():
         logger.info("仓位已清除")
 
 
@@ -162,35 +178,69 @@ async def connect_ib() -> IB:
     return ib
 
 
+def has_option_price(ticker) -> bool:
+    return has_price(ticker) or (ticker.bid > 0 and ticker.ask > 0)
+
+
+ticker_pool = TickerPool()
+
+
 async def get_stock_price(ib: IB, stock: Stock) -> float:
-    ticker = ib.reqMktData(stock, "", False, False)
-    await asyncio.sleep(2)
+    ticker = await ticker_pool.get(ib, stock, has_price)
     price = ticker.last or ticker.close or FALLBACK_PRICE
-    ib.cancelMktData(stock)
-    return price if price and not math.isnan(price) else FALLBACK_PRICE
+    return price if price and price == price else FALLBACK_PRICE
 
 
 async def get_option_price(ib: IB, option: Option) -> float:
     """获取期权价格"""
-    ticker = ib.reqMktData(option, "", False, False)
-    await asyncio.sleep(2)
+    ticker = await ticker_pool.get(ib, option, has_option_price)
     price = ticker.last or ticker.close or ((ticker.bid or 0) + (ticker.ask or 0)) / 2
-    ib.cancelMktData(option)
-    return price if price and not math.isnan(price) else 0.0
+    return price if price and price == price else 0.0
+
+
+def has_two_sided_quote(ticker) -> bool:
+    return ticker.bid > 0 and ticker.ask > 0
+
+
+def make_butterfly_combo(low: Option, mid: Option, high: Option) -> Contract:
+    """三条腿组成一个 BAG 合约（+1 / -2 / +1），整体报价、整体下单；BUY 开仓，SELL 平仓"""
+    return Contract(
+        symbol=SYMBOL, secType="BAG", exchange="SMART", currency=CURRENCY,
+        comboLegs=[
+            ComboLeg(conId=low.conId, ratio=1, action="BUY", exchange="SMART"),
+            ComboLeg(conId=mid.conId, ratio=2, action="SELL", exchange="SMART"),
+            ComboLeg(conId=high.conId, ratio=1, action="BUY", exchange="SMART"),
+        ],
+    )
+
+
+async def get_butterfly_price(ib: IB, low: Option, mid: Option, high: Option) -> float:
+    """蝶式组合单价：优先读 BAG 组合报价中间价（一个订阅），组合无报价时退回三条腿分别计算"""
+    ticker = await ticker_pool.get(ib, make_butterfly_combo(low, mid, high), has_two_sided_quote)
+    if has_two_sided_quote(ticker):
+        return (ticker.bid + ticker.ask) / 2
+    lp, mp, hp = await asyncio.gather(
+        get_option_price(ib, low),
+        get_option_price(ib, mid),
+        get_option_price(ib, high),
+    )
+    return lp - 2*mp + hp
 
 
 async def cancel_all_option_orders(ib: IB, symbol: str):
     open_trades = ib.openTrades()
-    count = 0
+    cancelled = []
     for trade in open_trades:
         c = trade.contract
-        if c.secType == "OPT" and c.symbol == symbol:
+        # 组合单的合约类型是 BAG
+        if c.secType in ("OPT", "BAG") and c.symbol == symbol:
             if trade.orderStatus.status in ["PendingSubmit", "PreSubmitted", "Submitted"]:
                 ib.cancelOrder(trade.order)
-                count += 1
-    if count:
-        await asyncio.sleep(2)
-        logger.info(f"✅ 已取消 {count} 个挂单")
+                cancelled.append(trade)
+    if cancelled:
+        # 所有撤单确认后立即返回，最多等 2 秒
+        await asyncio.gather(*(wait_for_done(t, 2) for t in cancelled))
+        logger.info(f"✅ 已取消 {len(cancelled)} 个挂单")
 
 
 async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[ButterflyPosition]:
@@ -201,80 +251,99 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[ButterflyPosi
     if not opts:
         return None
     
-    # 按照 Expiry 分组
-    from collections import defaultdict
-    by_expiry = defaultdict(list)
+    # 按照 Expiry 分组，组内 Call 按行权价建索引（四舍五入到分，避免浮点误差）
+    by_expiry = defaultdict(dict)
     for p in opts:
-        by_expiry[p.contract.lastTradeDateOrContractMonth].append(p)
+        if p.contract.right == 'C':
+            by_expiry[p.contract.lastTradeDateOrContractMonth][round(p.contract.strike, 2)] = p
         
-    for expiry, group in by_expiry.items():
+    for expiry, by_strike in by_expiry.items():
         # 需要至少3个腿
-        if len(group) < 3:
+        if len(by_strike) < 3:
             continue
-            
-        calls = [p for p in group if p.contract.right == 'C']
-        
-        # 简化识别：Long Call (Low) + Short Call (Mid) + Long Call (High)
-        # Quantity ratio: 1 : -2 : 1
-        # Sort by strike
-        calls.sort(key=lambda p: p.contract.strike)
+        strikes = sorted(by_strike)
         
-        if len(calls) >= 3:
-            # 滑动窗口检测
-            for i in range(len(calls) - 2):
-                low_leg = calls[i]
-                mid_leg = calls[i+1]
-                high_leg = calls[i+2]
-                
-                # 检查 Strike 等距
-                if not math.isclose(mid_leg.contract.strike - low_leg.contract.strike, 
-                                    high_leg.contract.strike - mid_leg.contract.strike, abs_tol=0.1):
+        # Long Call (Low) + Short Call (Mid) + Long Call (High)，数量比例 1 : -2 : 1
+        # 以每个空头腿为身体，向下逐个尝试下翼，上翼按等距直接查字典（不要求三腿相邻）
+        for j, mid in enumerate(strikes):
+            mid_leg = by_strike[mid]
+            qty_wing = -mid_leg.position / 2
+            if qty_wing <= 0:
+                continue
+            for low in reversed(strikes[:j]):
+                low_leg = by_strike[low]
+                if low_leg.position != qty_wing:
+                    continue
+                high_leg = by_strike.get(round(2 * mid - low, 2))
+                if high_leg is None or high_leg.position != qty_wing:
                     continue
-                    
-                # 检查方向和比例
-                # 典型蝶式: 1 Long, -2 Short, 1 Long
-                qty_low = low_leg.position
-                qty_mid = mid_leg.position
-                qty_high = high_leg.position
                 
-                # 检查是否为标准比例 1:-2:1
-                if qty_low > 0 and qty_high > 0 and qty_mid < 0:
-                    ratio_ok = (qty_low == abs(qty_mid)/2) and (qty_high == abs(qty_mid)/2)
-                    # 或者简单持仓检查
-                    if ratio_ok:
-                        logger.info(f"✅ 检测到 Butterfly: {expiry} Call {low_leg.contract.strike}/{mid_leg.contract.strike}/{high_leg.contract.strike}")
-                        
-                        local = load_local_position()
-                        cost = local.initial_cost if local else 0.0
-                        date = local.entry_date if local else ""
-                        
-                        return ButterflyPosition(
-                            symbol=symbol,
-                            lower_strike=low_leg.contract.strike,
-                            middle_strike=mid_leg.contract.strike,
-                            upper_strike=high_leg.contract.strike,
-                            expiry=expiry,
-                            contracts=int(qty_low),
-                            initial_cost=cost,
-                            entry_date=date
-                        )
+                logger.info(f"✅ 检测到 Butterfly: {expiry} Call {low_leg.contract.strike}/{mid_leg.contract.strike}/{high_leg.contract.strike}")
+                
+                local = load_local_position()
+                cost = local.initial_cost if local else 0.0
+                date = local.entry_date if local else ""
+                
+                return ButterflyPosition(
+                    symbol=symbol,
+                    lower_strike=low_leg.contract.strike,
+                    middle_strike=mid_leg.contract.strike,
+                    upper_strike=high_leg.contract.strike,
+                    expiry=expiry,
+                    contracts=int(qty_wing),
+                    initial_cost=cost,
+                    entry_date=date
+                )
     return None
 
 
+# 期权链缓存: symbol -> (日期, chain)；到期日/行权价列表当天不变
+_chain_cache: Dict[str, Tuple[str, Any]] = {}
+# 到期日 Call 合约缓存: (symbol, expiry) -> (获取时间, 按行权价升序的合约)；盘中可能加挂行权价，定时过期
+_calls_cache: Dict[Tuple[str, str], Tuple[float, List[Contract]]] = {}
+CALLS_CACHE_TTL_SEC = 600
+
+
+async def get_chain(ib: IB, stock: Stock):
+    """SMART 期权链参数（每个标的每天只请求一次）"""
+    today = datetime.now().strftime("%Y%m%d")
+    cached = _chain_cache.get(stock.symbol)
+    if cached and cached[0] == today:
+        return cached[1]
+    
+    chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
+    if not chains:
+        return None
+    chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
+    _chain_cache[stock.symbol] = (today, chain)
+    return chain
+
+
+async def get_expiry_calls(ib: IB, symbol: str, expiry: str) -> List[Contract]:
+    """某到期日全部 Call 合约（已带 conId），CALLS_CACHE_TTL_SEC 内复用"""
+    key = (symbol, expiry)
+    cached = _calls_cache.get(key)
+    if cached and time.monotonic() - cached[0] < CALLS_CACHE_TTL_SEC:
+        return cached[1]
+    
+    details = await ib.reqContractDetailsAsync(Option(symbol, expiry, exchange="SMART"))
+    calls = sorted([d.contract for d in details if d.contract.right == 'C'], key=lambda c: c.strike)
+    if calls:
+        _calls_cache[key] = (time.monotonic(), calls)
+    return calls
+
+
 async def open_butterfly(ib: IB, stock: Stock, price: float) -> Optional[ButterflyPosition]:
     """建立 Butterfly Spread 仓位"""
     logger.info("📦 正在开仓 Butterfly...")
     
-    chains = await ib.reqSecDefOptParamsAsync(stock.symbol, "", stock.secType, stock.conId)
-    if not chains:
+    chain = await get_chain(ib, stock)
+    if chain is None:
         logger.error("无法获取期权链")
         return None
-        
-    chain = next((c for c in chains if c.exchange == "SMART"), chains[0])
     
     # 获取有效到期日
-    import datetime as dt
-    target_date = (datetime.now() + dt.timedelta(days=14)).strftime("%Y%m%d") # 2周后
+    target_date = (datetime.now() + timedelta(days=14)).strftime("%Y%m%d") # 2周后
     valid_exps = sorted([e for e in chain.expirations if e > target_date])
     if not valid_exps:
         valid_exps = sorted([e for e in chain.expirations if e > datetime.now().strftime("%Y%m%d")])
@@ -285,110 +354,57 @@ async def open_butterfly(ib: IB, stock: Stock, price: float) -> Optional[Butterf
         
     expiry = valid_exps[0]
     
-    # 获取 Contract Details 以确保 Strike 存在
-    temp = Option(stock.symbol, expiry, exchange="SMART")
+    # 获取 Contract Details 以确保 Strike 存在（只看 Call）
     try:
-        details = await ib.reqContractDetailsAsync(temp)
+        valid_calls = await get_expiry_calls(ib, stock.symbol, expiry)
     except Exception as e:
         logger.error(f"无法获取合约详情: {e}")
         return None
         
-    if not details:
-        return None
-        
-    # 只看 Call
-    valid_calls = sorted([d.contract for d in details if d.contract.right == 'C'], key=lambda c: c.strike)
     if not valid_calls:
         return None
         
-    # 找 ATM Strike 作为 Body
-    mid_idx = -1
-    min_diff = float('inf')
-    for i, c in enumerate(valid_calls):
-        diff = abs(c.strike - price)
-        if diff < min_diff:
-            min_diff = diff
-            mid_idx = i
-            
-    if mid_idx == -1:
-        return None
-        
+    # 找 ATM Strike 作为 Body（行权价已升序，向量化计算距离）
+    strikes = np.fromiter((c.strike for c in valid_calls), dtype=np.float64, count=len(valid_calls))
+    mid_idx = int(np.abs(strikes - price).argmin())
+    mid_strike = strikes[mid_idx]
+    
     # 寻找 Wings
     # WING_PCT e.g. 0.05 => Strike +/- 5%
     wing_dist_req = price * WING_PCT
     
-    # 向上/下搜寻最接近 wing_dist 的 strike
-    mid_strike = valid_calls[mid_idx].strike
-    
-    low_idx = -1
-    min_dist_low = float('inf')
-    
-    high_idx = -1
-    min_dist_high = float('inf')
+    # 确定 Lower, 则 Upper = Mid + (Mid - Lower)
+    # 候选 Lower 从 mid 向下排列；对应的等距 Upper 用二分查找一次性求出
+    lower_idx = np.arange(mid_idx - 1, -1, -1)
+    widths = mid_strike - strikes[lower_idx]
+    target_upper = mid_strike + widths
+    upper_idx = np.searchsorted(strikes, target_upper - 0.01, side="right")
+    upper_idx_safe = np.minimum(upper_idx, len(strikes) - 1)
+    has_upper = (upper_idx < len(strikes)) & (np.abs(strikes[upper_idx_safe] - target_upper) < 0.01)
     
-    # 向下找 Lower Inner Wing (Standard Butterfly uses equidistant wings)
-    # 实际上我们只要找两个 equidistant 的点即可.
-    # 简单起见，遍历所有组合
-    # 但为了效率，我们从 mid 向两边找
-    
-    # 更好的方法：确定 Lower, 则 Upper = Mid + (Mid - Lower)
-    # 遍历可能的 Lower
-    best_combo = None
-    min_cost_diff = float('inf') # 这里不是指价格成本，而是指“偏离理想Wing宽度的程度”
-    
-    for i in range(mid_idx - 1, -1, -1):
-        lower_c = valid_calls[i]
-        width = mid_strike - lower_c.strike
-        target_upper = mid_strike + width
-        
-        # 检查是否存在 Upper
-        upper_c = next((c for c in valid_calls if abs(c.strike - target_upper) < 0.01), None)
-        
-        if upper_c:
-            # 找到一个组合
-            # 检查宽度是否接近理想值
-            diff_metric = abs(width - wing_dist_req)
-            if diff_metric < min_cost_diff:
-                min_cost_diff = diff_metric
-                best_combo = (lower_c, valid_calls[mid_idx], upper_c)
-                
-    if not best_combo:
+    if not has_upper.any():
          logger.error("无法找到合适的 Butterfly 组合 (等距Strike)")
          return None
+    
+    # 宽度最接近理想翼展的组合（相同时取靠近 mid 的 Lower，与逐个遍历一致）
+    k = int(np.where(has_upper, np.abs(widths - wing_dist_req), np.inf).argmin())
+    best_combo = (valid_calls[lower_idx[k]], valid_calls[mid_idx], valid_calls[upper_idx_safe[k]])
          
     low_opt, mid_opt, high_opt = best_combo
     
     # Qualify (already from details, usually qualified, but good to be safe for order)
     # details contracts are usually fully defined but let's just use them
     
-    # Get Prices
-    lp = await get_option_price(ib, low_opt)
-    mp = await get_option_price(ib, mid_opt)
-    hp = await get_option_price(ib, high_opt)
-    
-    net_cost = (lp - 2*mp + hp) * 100 * NUM_CONTRACTS
+    # Get Prices（组合报价，无报价时三条腿并发获取）
+    net_cost = await get_butterfly_price(ib, low_opt, mid_opt, high_opt) * 100 * NUM_CONTRACTS
     
     if SIMULATION_MODE:
         logger.info(f"[模拟] Butterfly: +1 {low_opt.strike}, -2 {mid_opt.strike}, +1 {high_opt.strike}, Cost: ${net_cost:.2f}")
     else:
-        # Place orders
-        # Leg 1: Buy Low
-        # Leg 2: Sell 2 Mid
-        # Leg 3: Buy High
-        
-        o1 = MarketOrder("BUY", NUM_CONTRACTS)
-        o2 = MarketOrder("SELL", 2 * NUM_CONTRACTS)
-        o3 = MarketOrder("BUY", NUM_CONTRACTS)
-        
-        t1 = ib.placeOrder(low_opt, o1)
-        t2 = ib.placeOrder(mid_opt, o2)
-        t3 = ib.placeOrder(high_opt, o3)
-        
-        MAX_WAIT = 15
-        for _ in range(MAX_WAIT):
-            if t1.isDone() and t2.isDone() and t3.isDone():
-                break
-            await asyncio.sleep(1)
+        # 组合单一次下单：Buy Low / Sell 2 Mid / Buy High 同时成交，不会只成交部分腿
+        combo = make_butterfly_combo(low_opt, mid_opt, high_opt)
+        trade = ib.placeOrder(combo, MarketOrder("BUY", NUM_CONTRACTS))
+        await wait_for_done(trade, 15)
             
         logger.info("✅ 订单提交完成")
         
@@ -418,24 +434,12 @@ async def close_butterfly(ib: IB, position: ButterflyPosition, reason: str):
     mid_opt = Option(position.symbol, position.expiry, position.middle_strike, "C", "SMART")
     high_opt = Option(position.symbol, position.expiry, position.upper_strike, "C", "SMART")
     
-    await ib.qualifyContractsAsync(low_opt)
-    await ib.qualifyContractsAsync(mid_opt)
-    await ib.qualifyContractsAsync(high_opt)
+    await ib.qualifyContractsAsync(low_opt, mid_opt, high_opt)
     
-    # Reverse ops
-    o1 = MarketOrder("SELL", position.contracts)
-    o2 = MarketOrder("BUY", 2 * position.contracts)
-    o3 = MarketOrder("SELL", position.contracts)
-    
-    t1 = ib.placeOrder(low_opt, o1)
-    t2 = ib.placeOrder(mid_opt, o2)
-    t3 = ib.placeOrder(high_opt, o3)
-    
-    MAX_WAIT = 15
-    for _ in range(MAX_WAIT):
-        if t1.isDone() and t2.isDone() and t3.isDone():
-            break
-        await asyncio.sleep(1)
+    # 卖出同一组合即为反向平仓
+    combo = make_butterfly_combo(low_opt, mid_opt, high_opt)
+    trade = ib.placeOrder(combo, MarketOrder("SELL", position.contracts))
+    await wait_for_done(trade, 15)
         
     logger.info("✅ 平仓完成")
     clear_position()
@@ -489,118 +493,186 @@ def print_status(state: StrategyState, action: str, reason: str):
     print("=" * 60)
 
 
-async def run_strategy(ib: IB, continuous: bool = False):
-    logger.info(f"启动 Butterfly 策略 (Continuous={continuous})")
-    
-    stock = Stock(SYMBOL, EXCHANGE, CURRENCY)
-    stock = (await ib.qualifyContractsAsync(stock))[0]
+async def get_leg_options(ib: IB, state: StrategyState) -> Tuple[Option, Option, Option]:
+    """持仓三条腿的合约：同一仓位只 qualify 一次，之后每次检查直接复用"""
+    pos = state.position
+    key = (pos.expiry, pos.lower_strike, pos.middle_strike, pos.upper_strike)
+    if state.leg_key != key:
+        legs = tuple(Option(SYMBOL, pos.expiry, strike, "C", "SMART") for strike in key[1:])
+        await ib.qualifyContractsAsync(*legs)
+        state.leg_options, state.leg_key = legs, key
+    return state.leg_options
+
+
+async def check_once(ib: IB, stock: Stock, state: StrategyState):
+    """执行一次检查：识别仓位 → 估值 → 止盈止损 / 开仓（可重复调用）"""
+    state.current_price = await get_stock_price(ib, stock)
     
-    state = StrategyState()
+    # 修复：优先使用本地状态文件识别仓位
+    # 1. 先加载本地保存的仓位
+    local_position = load_local_position()
     
-    while True:
-        state.current_price = await get_stock_price(ib, stock)
+    if local_position:
+        # 2. 验证 IBKR 中是否仍持有对应合约（至少有部分持仓）
+        positions = ib.positions()
+        opts = [p for p in positions if p.contract.symbol == SYMBOL and p.contract.secType == "OPT"]
         
-        # 修复：优先使用本地状态文件识别仓位
-        # 1. 先加载本地保存的仓位
-        local_position = load_local_position()
+        # 检查本地记录的三个腿是否在 IBKR 中存在
+        has_lower = any(
+            p.contract.strike == local_position.lower_strike and 
+            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
+            p.contract.right == "C" and p.position > 0
+            for p in opts
+        )
+        has_middle = any(
+            p.contract.strike == local_position.middle_strike and 
+            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
+            p.contract.right == "C" and p.position < 0
+            for p in opts
+        )
+        has_upper = any(
+            p.contract.strike == local_position.upper_strike and 
+            p.contract.lastTradeDateOrContractMonth == local_position.expiry and
+            p.contract.right == "C" and p.position > 0
+            for p in opts
+        )
         
-        if local_position:
-            # 2. 验证 IBKR 中是否仍持有对应合约（至少有部分持仓）
-            positions = ib.positions()
-            opts = [p for p in positions if p.contract.symbol == SYMBOL and p.contract.secType == "OPT"]
-            
-            # 检查本地记录的三个腿是否在 IBKR 中存在
-            has_lower = any(
-                p.contract.strike == local_position.lower_strike and 
-                p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-                p.contract.right == "C" and p.position > 0
-                for p in opts
-            )
-            has_middle = any(
-                p.contract.strike == local_position.middle_strike and 
-                p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-                p.contract.right == "C" and p.position < 0
-                for p in opts
-            )
-            has_upper = any(
-                p.contract.strike == local_position.upper_strike and 
-                p.contract.lastTradeDateOrContractMonth == local_position.expiry and
-                p.contract.right == "C" and p.position > 0
-                for p in opts
-            )
-            
-            if has_lower and has_middle and has_upper:
-                logger.info(f"✅ 从本地状态确认 Butterfly 仓位: {local_position.lower_strike}/{local_position.middle_strike}/{local_position.upper_strike} @ {local_position.expiry}")
-                state.position = local_position
-            else:
-                logger.warning(f"⚠️ 本地记录的 Butterfly 在 IBKR 中部分或全部不存在 (lower={has_lower}, mid={has_middle}, upper={has_upper})，清除本地记录")
-                clear_position()
-                state.position = None
+        if has_lower and has_middle and has_upper:
+            logger.info("✅ 从本地状态确认 Butterfly 仓位: %s/%s/%s @ %s", local_position.lower_strike,
+                local_position.middle_strike, local_position.upper_strike, local_position.expiry)
+            state.position = local_position
         else:
-            # 3. 没有本地记录，尝试从 IBKR 自动检测
-            state.position = await load_position_from_ibkr(ib, SYMBOL)
-            
-        action = "HOLD"
-        reason = "观察中"
+            logger.warning(f"⚠️ 本地记录的 Butterfly 在 IBKR 中部分或全部不存在 (lower={has_lower}, mid={has_middle}, upper={has_upper})，清除本地记录")
+            clear_position()
+            state.position = None
+    else:
+        # 3. 没有本地记录，尝试从 IBKR 自动检测
+        state.position = await load_position_from_ibkr(ib, SYMBOL)
         
-        if state.position:
-            # Update Value
-            l = Option(SYMBOL, state.position.expiry, state.position.lower_strike, "C", "SMART")
-            m = Option(SYMBOL, state.position.expiry, state.position.middle_strike, "C", "SMART")
-            h = Option(SYMBOL, state.position.expiry, state.position.upper_strike, "C", "SMART")
-            
-            await ib.qualifyContractsAsync(l)
-            await ib.qualifyContractsAsync(m)
-            await ib.qualifyContractsAsync(h)
-            
-            lp = await get_option_price(ib, l)
-            mp = await get_option_price(ib, m)
-            hp = await get_option_price(ib, h)
-            
-            curr_val = (lp - 2*mp + hp) * 100 * state.position.contracts
-            state.position.current_value = curr_val
-            
-            # 修复：如果 initial_cost 为 0，使用当前价值作为成本基础并保存
-            if state.position.initial_cost == 0 or abs(state.position.initial_cost) < 0.01:
-                state.position.initial_cost = curr_val
-                state.position.entry_date = state.position.entry_date or datetime.now().strftime("%Y-%m-%d")
-                logger.warning(f"⚠️ 缺失 initial_cost，使用当前市场价值 ${curr_val:.2f} 作为成本基础")
-                save_position(state.position)
+    action = "HOLD"
+    reason = "观察中"
+    
+    if state.position:
+        # Update Value
+        l, m, h = await get_leg_options(ib, state)
+        
+        curr_val = await get_butterfly_price(ib, l, m, h) * 100 * state.position.contracts
+        state.position.current_value = curr_val
+        
+        # 修复：如果 initial_cost 为 0，使用当前价值作为成本基础并保存
+        if state.position.initial_cost == 0 or abs(state.position.initial_cost) < 0.01:
+            state.position.initial_cost = curr_val
+            state.position.entry_date = state.position.entry_date or datetime.now().strftime("%Y-%m-%d")
+            logger.warning(f"⚠️ 缺失 initial_cost，使用当前市场价值 ${curr_val:.2f} 作为成本基础")
+            save_position(state.position)
+        
+        pnl = curr_val - state.position.initial_cost
+        cost = state.position.initial_cost
+        pnl_pct = pnl / cost if cost != 0 else 0
+        
+        if pnl_pct >= PROFIT_TARGET_PCT:
+            action = "CLOSE"
+            reason = f"止盈 ({pnl_pct:.1%})"
+        elif pnl_pct <= -STOP_LOSS_PCT: # Butterfly is debit strategy, max loss is 100% of cost usually
+            action = "CLOSE"
+            reason = f"止损 ({pnl_pct:.1%})"
             
-            pnl = curr_val - state.position.initial_cost
-            cost = state.position.initial_cost
-            pnl_pct = pnl / cost if cost != 0 else 0
+        if action == "CLOSE":
+            await close_butterfly(ib, state.position, reason)
+            state.position = None
+            state.leg_options = state.leg_key = None
+            ticker_pool.release(ib, keep=(stock.conId,))
             
-            if pnl_pct >= PROFIT_TARGET_PCT:
-                action = "CLOSE"
-                reason = f"止盈 ({pnl_pct:.1%})"
-            elif pnl_pct <= -STOP_LOSS_PCT: # Butterfly is debit strategy, max loss is 100% of cost usually
-                action = "CLOSE"
-                reason = f"止损 ({pnl_pct:.1%})"
-                
-            if action == "CLOSE":
-                await close_butterfly(ib, state.position, reason)
-                state.position = None
-                
+    else:
+        action = "OPEN"
+        reason = "无持仓，建立 Butterfly"
+        new_pos = await open_butterfly(ib, stock, state.current_price)
+        if new_pos:
+            state.position = new_pos
+            save_position(new_pos)
         else:
-            action = "OPEN"
-            reason = "无持仓，建立 Butterfly"
-            new_pos = await open_butterfly(ib, stock, state.current_price)
-            if new_pos:
-                state.position = new_pos
-                save_position(new_pos)
-            else:
-                action = "WAIT"
-                reason = "开仓失败 (未找到合适合约)"
-                
-        print_status(state, action, reason)
+            action = "WAIT"
+            reason = "开仓失败 (未找到合适合约)"
+            
+    print_status(state, action, reason)
+
+
+async def run_strategy(ib: IB, continuous: bool = False):
+    logger.info(f"启动 Butterfly 策略 (Continuous={continuous})")
+    
+    stock = Stock(SYMBOL, EXCHANGE, CURRENCY)
+    stock = (await ib.qualifyContractsAsync(stock))[0]
+    
+    state = StrategyState()
+    
+    while True:
+        await check_once(ib, stock, state)
         
         if not continuous:
+            ticker_pool.release(ib)
             break
             
         await asyncio.sleep(CHECK_INTERVAL_SEC)
 
 
+async def run_daemon(ib: IB):
+    """
+    常驻模式：保持 IB 连接和行情订阅，每收到一次 SIGUSR1 执行一次检查
+
+    省去 cron 每次启动时的连接握手、股票合约确认和行情订阅等待
+    """
+    import signal
+    loop = asyncio.get_running_loop()
+    trigger = asyncio.Event()
+    stopping = False
+
+    def request_stop():
+        nonlocal stopping
+        stopping = True
+        trigger.set()
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, trigger.set)
+        loop.add_signal_handler(signal.SIGTERM, request_stop)
+        loop.add_signal_handler(signal.SIGINT, request_stop)
+    except (AttributeError, NotImplementedError):
+        # Windows 没有 SIGUSR1，也不支持 add_signal_handler
+        logger.error("当前平台不支持 daemon 模式，请使用 BF_MODE=daily + 计划任务")
+        return
+
+    stock = Stock(SYMBOL, EXCHANGE, CURRENCY)
+    stock = (await ib.qualifyContractsAsync(stock))[0]
+    state = StrategyState()
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(PID_FILE, 'w') as f:
+        f.write(str(os.getpid()))
+    logger.info(f"Butterfly daemon 已启动 (pid={os.getpid()})，等待 SIGUSR1: kill -USR1 $(cat {PID_FILE})")
+
+    try:
+        while True:
+            await trigger.wait()
+            trigger.clear()
+            if stopping:
+                break
+            try:
+                if not ib.isConnected():
+                    # 断线后旧订阅失效，重连并重新订阅
+                    logger.warning("IB 连接已断开，重新连接")
+                    ticker_pool.tickers.clear()
+                    await ib.connectAsync(IB_HOST, IB_PORT, clientId=IB_CLIENT_ID)
+                    ib.reqMarketDataType(3 if USE_DELAYED_DATA else 1)
+                await check_once(ib, stock, state)
+            except Exception as e:
+                # 重连或单次检查失败都不退出常驻进程，下一次触发时重试
+                logger.error(f"检查失败: {e}", exc_info=True)
+    finally:
+        ticker_pool.release(ib)
+        if os.path.exists(PID_FILE):
+            os.remove(PID_FILE)
+        logger.info("Butterfly daemon 已退出")
+
+
 async def main():
     import signal
     def handle_shutdown(signum, frame):
@@ -613,6 +685,8 @@ async def main():
             await close_all_positions(ib)
         elif RUN_MODE == "continuous":
             await run_strategy(ib, continuous=True)
+        elif RUN_MODE == "daemon":
+            await run_daemon(ib)
         else:
             await run_strategy(ib, continuous=False)
     except Exception as e:
@@ -622,4 +696,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run(main())
@@ -27,14 +27,16 @@ CAL_MODE=continuous uv run demo15_calendar_spread_theta.py
 """
 import asyncio
 import os
-import math
-import json
 import logging
 from datetime import datetime
 from typing import Optional, List, Dict, Tuple
 from dataclasses import dataclass, field, asdict
 
-from ib_async import IB, Stock, Option, MarketOrder
+import numpy as np
+from ib_async import IB, Stock, Option, MarketOrder, Contract, ComboLeg
+
+from state_store import StateStore, DB_FILE
+from market_data import TickerPool, has_price, wait_for_done
 
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s - %(levelname)s - %(message)s")
@@ -55,6 +57,8 @@ BACK_EXPIRY_IDX = int(os.getenv("CAL_BACK_IDX", "3"))
 PROFIT_TARGET_PCT = float(os.getenv("CAL_PROFIT_TARGET", "0.30"))
 STOP_LOSS_PCT = float(os.getenv("CAL_STOP_LOSS", "0.50"))
 CHECK_INTERVAL_SEC = int(os.getenv("CAL_CHECK_INTERVAL", "60"))
+# 首次订阅期权时等待 modelGreeks 的上限（延迟行情下 Greeks 往往晚于价格到达）
+GREEKS_TIMEOUT_SEC = float(os.getenv("CAL_GREEKS_TIMEOUT", "5"))
 FALLBACK_PRICE = float(os.getenv("CAL_FALLBACK_PRICE", "280"))
 
 # 运行模式
@@ -63,8 +67,8 @@ RUN_MODE = os.getenv("CAL_MODE", "daily")
 USE_DELAYED_DATA = os.getenv("CAL_USE_DELAYED", "true").lower() == "true"
 SIMULATION_MODE = os.getenv("CAL_SIMULATION", "false").lower() == "true"
 
-STATE_DIR = os.path.join(os.path.dirname(__file__), ".states")
-STATE_FILE = os.path.join(STATE_DIR, f"calendar_spread_{SYMBOL.lower()}.json")
+# 仓位存储（共用 SQLite 库，首次读取时迁移旧版 .states/calendar_spread_<symbol>.json）
+position_store = StateStore("calendar_spread", SYMBOL)
 
 
 @dataclass
@@ -103,36 +107,42 @@ class StrategyState:
     net_theta: float = 0.0
     front_iv: float = 0.0
     back_iv: float = 0.0
+    # 已 qualify 的两条腿 (近期, 远期)，leg_key 对应 (近期, 远期, 行权价, 类型)
+    leg_options: Optional[Tuple[Option, Option]] = None
+    leg_key: Optional[Tuple[str, str, float, str]] = None
+
+
+# 上次写入的仓位内容，未变化时跳过写入
+_last_saved_position: Optional[Dict] = None
 
 
 def load_local_position() -> Optional[CalendarPosition]:
-    os.makedirs(STATE_DIR, exist_ok=True)
-    if not os.path.exists(STATE_FILE):
-        return None
+    """从仓位存储加载仓位（库未变化时直接命中 StateStore 缓存）"""
     try:
-        with open(STATE_FILE, 'r') as f:
-            data = json.load(f)
-            return CalendarPosition.from_dict(data['position'])
+        data = position_store.load()
+        # 每次返回新对象，调用方修改仓位不会污染缓存
+        return CalendarPosition.from_dict(data) if data else None
     except Exception as e:
         logger.error(f"加载仓位失败: {e}")
         return None
 
 
 def save_position(position: CalendarPosition):
-    os.makedirs(STATE_DIR, exist_ok=True)
-    data = {
-        'position': position.to_dict(),
-        'last_updated': datetime.now().isoformat(),
-        'symbol': SYMBOL
-    }
-    with open(STATE_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
-    logger.info(f"仓位已保存: {STATE_FILE}")
+    """保存仓位，单行 INSERT OR REPLACE（事务写入，中途崩溃不会留下半截数据）"""
+    global _last_saved_position
+    position_data = position.to_dict()
+    # 内容未变且库中记录仍在时跳过；记录被清除时照常重写
+    if position_data == _last_saved_position and position_store.load() is not None:
+        return
+    position_store.save(position_data)
+    _last_saved_position = position_data
+    logger.info(f"仓位已保存: {DB_FILE} ({position_store.strategy_name}/{position_store.symbol})")
 
 
 def clear_position():
-    if os.path.exists(STATE_FILE):
-        os.remove(STATE_FILE)
+    global _last_saved_position
+    _last_saved_position = None
+    if position_store.clear():
         logger.info("仓位已清除")
 
 
@@ -143,26 +153,35 @@ async def connect_ib() -> IB:
     return ib
 
 
+def has_price_and_greeks(ticker) -> bool:
+    greeks = ticker.modelGreeks
+    return (has_price(ticker) or (ticker.bid > 0 and ticker.ask > 0)) \
+        and greeks is not None and greeks.theta is not None
+
+
+ticker_pool = TickerPool()
+
+
 async def get_stock_price(ib: IB, stock: Stock) -> float:
-    ticker = ib.reqMktData(stock, "", False, False)
-    await asyncio.sleep(2)
+    ticker = await ticker_pool.get(ib, stock, has_price)
     price = ticker.last or ticker.close or FALLBACK_PRICE
-    ib.cancelMktData(stock)
-    return price if price and not math.isnan(price) else FALLBACK_PRICE
+    return price if price and price == price else FALLBACK_PRICE
 
 
 async def cancel_all_option_orders(ib: IB, symbol: str):
     open_trades = ib.openTrades()
-    count = 0
+    cancelled = []
     for trade in open_trades:
         c = trade.contract
-        if c.secType == "OPT" and c.symbol == symbol:
+        # 组合单的合约类型是 BAG
+        if c.secType in ("OPT", "BAG") and c.symbol == symbol:
             if trade.orderStatus.status in ["PendingSubmit", "PreSubmitted", "Submitted"]:
                 ib.cancelOrder(trade.order)
-                count += 1
-    if count:
-        await asyncio.sleep(2)
-        logger.info(f"✅ 已取消 {count} 个挂单")
+                cancelled.append(trade)
+    if cancelled:
+        # 所有撤单确认后立即返回，最多等 2 秒
+        await asyncio.gather(*(wait_for_done(t, 2) for t in cancelled))
+        logger.info(f"✅ 已取消 {len(cancelled)} 个挂单")
 
 
 async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[CalendarPosition]:
@@ -214,16 +233,29 @@ async def load_position_from_ibkr(ib: IB, symbol: str) -> Optional[CalendarPosit
 
 
 async def get_option_greeks(ib: IB, option: Option) -> Tuple[float, float]: # Price, Theta
-    ticker = ib.reqMktData(option, "106", False, False)
-    await asyncio.sleep(2)
+    # 首次订阅时等到价格和 modelGreeks 都到齐（实时行情通常远小于上限即返回）；
+    # 之后 Greeks 随订阅持续推送，直接读取
+    ticker = await ticker_pool.get(ib, option, has_price_and_greeks, "106", GREEKS_TIMEOUT_SEC)
     price = ticker.last or ticker.close or ((ticker.bid or 0) + (ticker.ask or 0)) / 2
+    if price != price:  # NaN
+        price = 0.0
     theta = 0.0
     if ticker.modelGreeks and ticker.modelGreeks.theta:
         theta = ticker.modelGreeks.theta
-    ib.cancelMktData(option)
     return price, theta
 
 
+def make_calendar_combo(front: Option, back: Option) -> Contract:
+    """两条腿组成一个 BAG 合约（卖近 / 买远），整体下单；BUY 开仓，SELL 平仓"""
+    return Contract(
+        symbol=SYMBOL, secType="BAG", exchange="SMART", currency=CURRENCY,
+        comboLegs=[
+            ComboLeg(conId=back.conId, ratio=1, action="BUY", exchange="SMART"),
+            ComboLeg(conId=front.conId, ratio=1, action="SELL", exchange="SMART"),
+        ],
+    )
+
+
 async def open_calendar_spread(ib: IB, stock: Stock, price: float) -> Optional[CalendarPosition]:
     """开仓: 卖近 买远"""
     logger.info("📦 正在开仓 Calendar Spread...")
@@ -269,7 +301,8 @@ async def open_calendar_spread(ib: IB, stock: Stock, price: float) -> Optional[C
     right = valid_front[0].right
     
     # 找最接近现价的 Strike
-    best_front = min(valid_front, key=lambda c: abs(c.strike - price))
+    strikes = np.fromiter((c.strike for c in valid_front), dtype=np.float64, count=len(valid_front))
+    best_front = valid_front[int(np.abs(strikes - price).argmin())]
     strike = best_front.strike
     
     front_opt = best_front
@@ -287,8 +320,9 @@ async def open_calendar_spread(ib: IB, stock: Stock, price: float) -> Optional[C
         logger.error(f"远月合约 {back_exp} Strike {strike} 不存在: {e}")
         return None
     
-    fp, _ = await get_option_greeks(ib, front_opt)
-    bp, _ = await get_option_greeks(ib, back_opt)
+    # 两条腿同时订阅、同时等待
+    (fp, _), (bp, _) = await asyncio.gather(
+        get_option_greeks(ib, front_opt), get_option_greeks(ib, back_opt))
     
     net_debit_per = bp - fp
     total_cost = net_debit_per * 100 * NUM_CONTRACTS
@@ -296,19 +330,11 @@ async def open_calendar_spread(ib: IB, stock: Stock, price: float) -> Optional[C
     if SIMULATION_MODE:
         logger.info(f"[模拟] 买入 {back_exp} {right}, 卖出 {front_exp} {right} @ {strike}, 净支出 ${total_cost:.2f}")
     else:
-        # 腿 1: 买 Back
-        b_order = MarketOrder("BUY", NUM_CONTRACTS)
-        b_trade = ib.placeOrder(back_opt, b_order)
-        
-        # 腿 2: 卖 Front
-        f_order = MarketOrder("SELL", NUM_CONTRACTS)
-        f_trade = ib.placeOrder(front_opt, f_order)
+        # 买 Back + 卖 Front 作为一个组合单提交，两条腿同时成交
+        trade = ib.placeOrder(make_calendar_combo(front_opt, back_opt),
+                              MarketOrder("BUY", NUM_CONTRACTS))
         
-        MAX_WAIT = 10
-        for _ in range(MAX_WAIT):
-            if b_trade.isDone() and f_trade.isDone():
-                break
-            await asyncio.sleep(1)
+        await wait_for_done(trade, 10)
             
         logger.info("✅ 订单提交完成")
         
@@ -335,18 +361,13 @@ async def close_position(ib: IB, position: CalendarPosition, reason: str):
 
     front_opt = Option(position.symbol, position.front_expiry, position.strike, position.rights, "SMART")
     back_opt = Option(position.symbol, position.back_expiry, position.strike, position.rights, "SMART")
-    await ib.qualifyContractsAsync(front_opt)
-    await ib.qualifyContractsAsync(back_opt)
+    await ib.qualifyContractsAsync(front_opt, back_opt)
     
-    # 平仓: 买回 Front, 卖出 Back
-    f_order = MarketOrder("BUY", position.contracts)
-    b_order = MarketOrder("SELL", position.contracts)
+    # 平仓: 卖出组合 = 买回 Front + 卖出 Back
+    trade = ib.placeOrder(make_calendar_combo(front_opt, back_opt),
+                          MarketOrder("SELL", position.contracts))
     
-    ft = ib.placeOrder(front_opt, f_order)
-    bt = ib.placeOrder(back_opt, b_order)
-    
-    while not (ft.isDone() and bt.isDone()):
-        await asyncio.sleep(1)
+    await wait_for_done(trade, None)
         
     logger.info("✅ 平仓完成")
     clear_position()
@@ -398,6 +419,18 @@ def print_status(state: StrategyState, action: str, reason: str):
     print("=" * 60)
 
 
+async def get_leg_options(ib: IB, state: StrategyState) -> Tuple[Option, Option]:
+    """持仓两条腿的合约：同一仓位只 qualify 一次，之后每次检查直接复用"""
+    pos = state.position
+    key = (pos.front_expiry, pos.back_expiry, pos.strike, pos.rights)
+    if state.leg_key != key:
+        legs = (Option(SYMBOL, pos.front_expiry, pos.strike, pos.rights, "SMART"),
+                Option(SYMBOL, pos.back_expiry, pos.strike, pos.rights, "SMART"))
+        await ib.qualifyContractsAsync(*legs)
+        state.leg_options, state.leg_key = legs, key
+    return state.leg_options
+
+
 async def run_strategy(ib: IB, continuous: bool = False):
     logger.info(f"启动 Calendar 策略 (Continuous={continuous})")
     
@@ -450,13 +483,10 @@ async def run_strategy(ib: IB, continuous: bool = False):
         
         if state.position:
             # Update Value
-            f_opt = Option(SYMBOL, state.position.front_expiry, state.position.strike, state.position.rights, "SMART")
-            b_opt = Option(SYMBOL, state.position.back_expiry, state.position.strike, state.position.rights, "SMART")
-            await ib.qualifyContractsAsync(f_opt)
-            await ib.qualifyContractsAsync(b_opt)
+            f_opt, b_opt = await get_leg_options(ib, state)
             
-            fp, ft = await get_option_greeks(ib, f_opt)
-            bp, bt = await get_option_greeks(ib, b_opt)
+            (fp, ft), (bp, bt) = await asyncio.gather(
+                get_option_greeks(ib, f_opt), get_option_greeks(ib, b_opt))
             
             # Short Front (Theta is positive for us), Long Back (Theta is negative cost)
             # Typically Short Option has Positive Theta (earns money), Long has Negative
@@ -501,6 +531,8 @@ async def run_strategy(ib: IB, continuous: bool = False):
             if action == "CLOSE":
                 await close_position(ib, state.position, reason)
                 state.position = None
+                state.leg_options = state.leg_key = None
+                ticker_pool.release(ib, keep=(stock.conId,))
                 
         else:
             # Check Open
@@ -516,6 +548,7 @@ async def run_strategy(ib: IB, continuous: bool = False):
         print_status(state, action, reason)
         
         if not continuous:
+            ticker_pool.release(ib)
             break
         
         await asyncio.sleep(CHECK_INTERVAL_SEC)
@@ -61,7 +61,6 @@ JL_CALL_LONG_OTM=0.10   # 买Call虚值 10%
 """
 import asyncio
 import os
-import math
 import logging
 from datetime import datetime
 from typing import Optional, Tuple
@@ -152,7 +151,7 @@ async def get_stock_price(ib: IB, stock: Stock) -> float:
     await asyncio.sleep(2)
     price = ticker.last or ticker.close or FALLBACK_PRICE
     ib.cancelMktData(stock)
-    return price if price and not math.isnan(price) else FALLBACK_PRICE
+    return price if price and price == price else FALLBACK_PRICE
 
 
 async def get_option_price(ib: IB, option: Option) -> float:
@@ -161,7 +160,7 @@ async def get_option_price(ib: IB, option: Option) -> float:
     price = ticker.last or ticker.close or (
         (ticker.bid or 0) + (ticker.ask or 0)) / 2
     ib.cancelMktData(option)
-    return price if price and not math.isnan(price) else 0.0
+    return price if price and price == price else 0.0
 
 
 async def find_option(ib: IB, stock: Stock, right: str, strike: float, expiry: str) -> Optional[Option]:
@@ -51,16 +51,27 @@ IB_WING_PCT=0.05  # 翼宽 5%（保护距离）
 """
 import asyncio
 import os
-import math
+import time
 import logging
 from datetime import datetime
 from typing import Optional, Tuple
 from dataclasses import dataclass, field
 
-from ib_async import IB, Stock, Option
+import numpy as np
 
-logging.basicConfig(level=logging.INFO,
-                    format="%(asctime)s - %(levelname)s - %(message)s")
+try:
+    # numba 可选：安装后行权价选择走 JIT 内核，否则使用 numpy 实现
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+from ib_async import IB, Stock, Option, Ticker
+
+from runtime import setup_queue_logging, run
+from market_data import wait_for_ticker, has_price
+
+# 日志经队列交给后台线程写终端，监控循环里的 logger 调用只做入队，不阻塞在 I/O 上
+setup_queue_logging()
 logger = logging.getLogger(__name__)
 
 IB_HOST = os.getenv("IB_HOST", "127.0.0.1")
@@ -75,16 +86,25 @@ NUM_CONTRACTS = int(os.getenv("IBF_CONTRACTS", "1"))
 WING_PCT = float(os.getenv("IBF_WING_PCT", "0.05"))
 PROFIT_TARGET_PCT = float(os.getenv("IBF_PROFIT_TARGET", "0.50"))
 STOP_LOSS_PCT = float(os.getenv("IBF_STOP_LOSS", "1.0"))
+# 行情推送驱动检查；此间隔只用于限制状态日志频率
 CHECK_INTERVAL_SEC = int(os.getenv("IBF_CHECK_INTERVAL", "60"))
 FALLBACK_PRICE = float(os.getenv("IBF_FALLBACK_PRICE", "280"))
 
 USE_DELAYED_DATA = os.getenv("IBF_USE_DELAYED", "true").lower() == "true"
 SIMULATION_MODE = os.getenv("IBF_SIMULATION", "true").lower() == "true"
 
-shutdown_requested = False
+# 退出信号：SIGINT/SIGTERM 时置位，主循环等待它而不是轮询全局标志
+shutdown_event = asyncio.Event()
+# 主循环唤醒信号：有订阅的 ticker 更新或收到退出信号时置位
+wake_event = asyncio.Event()
+
+
+def request_shutdown():
+    shutdown_event.set()
+    wake_event.set()
 
 
-@dataclass
+@dataclass(slots=True)
 class IronButterflyPosition:
     """Iron Butterfly 仓位"""
     atm_strike: float = 0.0      # ATM 行权价（卖Call+Put）
@@ -110,7 +130,7 @@ class IronButterflyPosition:
         return (self.atm_strike - margin, self.atm_strike + margin)
 
 
-@dataclass
+@dataclass(slots=True)
 class StrategyState:
     position: IronButterflyPosition = field(
         default_factory=IronButterflyPosition)
@@ -122,6 +142,21 @@ class StrategyState:
     short_call: Optional[Option] = None
     long_call: Optional[Option] = None
 
+    bar_template: str = ""  # 价格条静态部分，建仓时生成
+    # 止盈/止损对应的组合价值（建仓后不变；卖方组合价值越低越赚）
+    tp_value: float = float("-inf")
+    sl_value: float = float("inf")
+
+    # 持续订阅的行情：股票 + 四条腿（买Put, 卖Put, 卖Call, 买Call）
+    stock_ticker: Optional[Ticker] = None
+    leg_tickers: Tuple[Ticker, ...] = ()
+
+    def hit_exit(self, value: float) -> bool:
+        """组合价值是否触及止盈/止损阈值（净借方建仓时方向相反）"""
+        if self.position.initial_credit < 0:
+            return value >= self.tp_value or value <= self.sl_value
+        return value <= self.tp_value or value >= self.sl_value
+
     def get_pnl(self) -> float:
         return self.position.initial_credit - self.position.current_value
 
@@ -138,30 +173,48 @@ async def connect_ib() -> IB:
     return ib
 
 
+async def snapshot_ticker(ib: IB, contract, ready):
+    """
+    快照行情：服务器发完一次完整快照后自动结束订阅，无需 cancelMktData
+
+    快照被拒绝（没有数据返回）时退回流式订阅 + 取消
+    """
+    ticker = ib.reqMktData(contract, "", True, False)
+    await wait_for_ticker(ticker, ready)
+    if not ready(ticker):
+        ticker = ib.reqMktData(contract, "", False, False)
+        await wait_for_ticker(ticker, ready)
+        ib.cancelMktData(contract)
+    return ticker
+
+
 async def get_stock_price(ib: IB, stock: Stock) -> float:
-    ticker = ib.reqMktData(stock, "", False, False)
-    await asyncio.sleep(2)
+    ticker = await snapshot_ticker(ib, stock, has_price)
     price = ticker.last or ticker.close or FALLBACK_PRICE
-    ib.cancelMktData(stock)
-    return price if price and not math.isnan(price) else FALLBACK_PRICE
+    return price if price and price == price else FALLBACK_PRICE
 
 
-async def get_option_price(ib: IB, option: Option) -> float:
-    ticker = ib.reqMktData(option, "", False, False)
-    await asyncio.sleep(2)
+def option_mark(ticker: Ticker) -> float:
     price = ticker.last or ticker.close or (
         (ticker.bid or 0) + (ticker.ask or 0)) / 2
-    ib.cancelMktData(option)
-    return price if price and not math.isnan(price) else 0.0
+    return price if price and price == price else 0.0
 
 
-async def find_option(ib: IB, stock: Stock, right: str, strike: float, expiry: str) -> Optional[Option]:
-    option = Option(stock.symbol, expiry, strike, right, "SMART")
+async def find_options(ib: IB, stock: Stock, specs: list) -> list:
+    """
+    批量确认期权合约
+
+    specs: [(right, strike, expiry), ...]
+    返回与 specs 对应的合约列表，无法确认的位置为 None；所有腿在一次 qualifyContractsAsync 调用中确认。
+    """
+    options = [Option(stock.symbol, expiry, strike, right, "SMART") for right, strike, expiry in specs]
     try:
-        qualified = await ib.qualifyContractsAsync(option)
-        return qualified[0] if qualified else None
-    except:
-        return None
+        await ib.qualifyContractsAsync(*options)
+    except Exception as e:
+        logger.warning(f"确认期权合约失败: {e}")
+        return [None] * len(specs)
+    # qualifyContractsAsync 原地补全合约，conId 非 0 即确认成功
+    return [option if option.conId else None for option in options]
 
 
 async def get_option_chain_info(ib: IB, stock: Stock) -> Tuple[list, list]:
@@ -173,86 +226,152 @@ async def get_option_chain_info(ib: IB, stock: Stock) -> Tuple[list, list]:
     return sorted([e for e in chain.expirations if e > today]), sorted(chain.strikes)
 
 
+if HAS_NUMBA:
+    # 显式签名：导入时即编译，cache=True 时 cron 式重复启动直接加载磁盘缓存
+    @njit("UniTuple(int64, 3)(float64[:], float64, float64)", cache=True, fastmath=True)
+    def pick_strikes_kernel(strikes, price, wing_pct):
+        """单次扫描 + 两次半边扫描，返回 (下翼, ATM, 上翼) 下标"""
+        n = strikes.shape[0]
+        mid = 0
+        best = abs(strikes[0] - price)
+        for i in range(1, n):
+            d = abs(strikes[i] - price)
+            if d < best:
+                best = d
+                mid = i
+        lo = mid
+        target = price * (1 - wing_pct)
+        best = 1e18
+        for i in range(mid):
+            d = abs(strikes[i] - target)
+            if d < best:
+                best = d
+                lo = i
+        up = mid
+        target = price * (1 + wing_pct)
+        best = 1e18
+        for i in range(mid + 1, n):
+            d = abs(strikes[i] - target)
+            if d < best:
+                best = d
+                up = i
+        return lo, mid, up
+
+
+def pick_strikes(strikes: np.ndarray, price: float, wing_pct: float) -> Tuple[int, int, int]:
+    """
+    在升序行权价数组中选出 Iron Butterfly 三个行权价的下标 (下翼, ATM, 上翼)
+
+    翼只在 ATM 对应一侧查找；该侧没有行权价时退回 ATM 下标（而不是误选数组首个）
+    """
+    if HAS_NUMBA:
+        return pick_strikes_kernel(strikes, price, wing_pct)
+    mid = int(np.argmin(np.abs(strikes - price)))
+    lo = int(np.argmin(np.abs(strikes[:mid] - price * (1 - wing_pct)))) if mid > 0 else mid
+    up = mid + 1 + int(np.argmin(np.abs(strikes[mid + 1:] - price * (1 + wing_pct)))) \
+        if mid + 1 < strikes.size else mid
+    return lo, mid, up
+
+
+# 价格可视化条长度
+BAR_LEN = 40
+
+
+def make_bar_template(pos: IronButterflyPosition) -> str:
+    """价格条的静态部分（只含 ◆ 最大盈利点），建仓后不变，只需生成一次"""
+    range_width = pos.upper_strike - pos.lower_strike
+    if range_width <= 0:
+        return ""
+    atm_idx = int((pos.atm_strike - pos.lower_strike) / range_width * BAR_LEN)
+    bar = ["─"] * BAR_LEN
+    if 0 <= atm_idx < BAR_LEN:
+        bar[atm_idx] = "◆"
+    return "".join(bar)
+
+
 def print_status(state: StrategyState, reason: str = ""):
     pos = state.position
-    print("\n" + "=" * 60)
-    print(f"🦋 Iron Butterfly 状态 {'(' + reason + ')' if reason else ''}")
-    print("=" * 60)
-    print(f"股价: ${state.current_price:.2f} | ATM: ${pos.atm_strike:.2f}")
-    print("-" * 60)
-    print("【结构】")
-    print(f"  买Put ${pos.lower_strike:.0f} ← 卖Put ${pos.atm_strike:.0f} = 卖Call ${pos.atm_strike:.0f} → 买Call ${pos.upper_strike:.0f}")
-
-    # 价格可视化
-    range_width = pos.upper_strike - pos.lower_strike
-    if range_width > 0:
-        price_pos = (state.current_price - pos.lower_strike) / range_width
-        bar_len = 40
-        price_idx = int(price_pos * bar_len)
-        atm_idx = int((pos.atm_strike - pos.lower_strike) /
-                      range_width * bar_len)
-        bar = ["─"] * bar_len
-        if 0 <= atm_idx < bar_len:
-            bar[atm_idx] = "◆"
-        if 0 <= price_idx < bar_len:
-            bar[price_idx] = "●"
-        print(f"  [{(''.join(bar))}]")
-        print(f"  ● 当前  ◆ 最大盈利点")
+    lines = [
+        "\n" + "=" * 60,
+        f"🦋 Iron Butterfly 状态 {'(' + reason + ')' if reason else ''}",
+        "=" * 60,
+        f"股价: ${state.current_price:.2f} | ATM: ${pos.atm_strike:.2f}",
+        "-" * 60,
+        "【结构】",
+        f"  买Put ${pos.lower_strike:.0f} ← 卖Put ${pos.atm_strike:.0f} = 卖Call ${pos.atm_strike:.0f} → 买Call ${pos.upper_strike:.0f}",
+    ]
+
+    # 价格可视化：模板建仓时生成，这里只放入当前价格标记
+    bar = state.bar_template
+    if bar:
+        price_idx = int((state.current_price - pos.lower_strike) /
+                        (pos.upper_strike - pos.lower_strike) * BAR_LEN)
+        if 0 <= price_idx < BAR_LEN:
+            bar = bar[:price_idx] + "●" + bar[price_idx + 1:]
+        lines.append(f"  [{bar}]")
+        lines.append(f"  ● 当前  ◆ 最大盈利点")
 
     # 距离分析
     distance = abs(state.current_price - pos.atm_strike) / pos.atm_strike * 100
     if distance < 1:
-        print(f"  ✅ 接近最大盈利点！距离 {distance:.1f}%")
+        lines.append(f"  ✅ 接近最大盈利点！距离 {distance:.1f}%")
     elif distance < 3:
-        print(f"  🟡 距离最大盈利点 {distance:.1f}%")
+        lines.append(f"  🟡 距离最大盈利点 {distance:.1f}%")
     else:
-        print(f"  ⚠️ 偏离最大盈利点 {distance:.1f}%")
+        lines.append(f"  ⚠️ 偏离最大盈利点 {distance:.1f}%")
 
     profit_range = pos.get_profit_range()
-    print(f"  盈利区间: ${profit_range[0]:.2f} ~ ${profit_range[1]:.2f}")
-
-    print("-" * 60)
-    print("【盈亏】")
-    print(f"  初始权利金: ${pos.initial_credit:.2f}")
-    print(f"  最大盈利: ${pos.get_max_profit():.2f}（股价=${pos.atm_strike:.0f}）")
-    print(f"  最大亏损: ${pos.get_max_loss():.2f}")
-    print(f"  当前盈亏: ${state.get_pnl():+.2f} ({state.get_pnl_pct():+.1%})")
-    print("=" * 60)
+    lines += [
+        f"  盈利区间: ${profit_range[0]:.2f} ~ ${profit_range[1]:.2f}",
+        "-" * 60,
+        "【盈亏】",
+        f"  初始权利金: ${pos.initial_credit:.2f}",
+        f"  最大盈利: ${pos.get_max_profit():.2f}（股价=${pos.atm_strike:.0f}）",
+        f"  最大亏损: ${pos.get_max_loss():.2f}",
+        f"  当前盈亏: ${state.get_pnl():+.2f} ({state.get_pnl_pct():+.1%})",
+        "=" * 60,
+    ]
+    # 一次性输出
+    print("\n".join(lines))
 
 
 async def build_iron_butterfly(ib: IB, stock: Stock, state: StrategyState):
-    price = await get_stock_price(ib, stock)
+    # 股价与期权链互不依赖，同时请求
+    price, (expiries, strikes) = await asyncio.gather(
+        get_stock_price(ib, stock), get_option_chain_info(ib, stock))
     state.current_price = price
 
-    expiries, strikes = await get_option_chain_info(ib, stock)
     if not expiries or not strikes:
         raise RuntimeError("无法获取期权链")
 
     expiry = expiries[1] if len(expiries) > 1 else expiries[0]
 
-    # ATM 行权价
-    atm_strike = min(strikes, key=lambda x: abs(x - price))
-    lower_strike = min(strikes, key=lambda x: abs(
-        x - price * (1 - WING_PCT)) if x < atm_strike else float('inf'))
-    upper_strike = min(strikes, key=lambda x: abs(
-        x - price * (1 + WING_PCT)) if x > atm_strike else float('inf'))
+    # ATM 行权价 + 两翼（期权链已排序，一次调用选出三个下标）
+    strike_arr = np.asarray(strikes, dtype=np.float64)
+    lo, mid, up = pick_strikes(strike_arr, price, WING_PCT)
+    atm_strike = strikes[mid]
+    lower_strike = strikes[lo]
+    upper_strike = strikes[up]
 
     logger.info(f"构建 Iron Butterfly @ {expiry}")
     logger.info(
         f"  买Put ${lower_strike} | 卖Put+Call ${atm_strike} | 买Call ${upper_strike}")
 
-    state.long_put = await find_option(ib, stock, "P", lower_strike, expiry)
-    state.short_put = await find_option(ib, stock, "P", atm_strike, expiry)
-    state.short_call = await find_option(ib, stock, "C", atm_strike, expiry)
-    state.long_call = await find_option(ib, stock, "C", upper_strike, expiry)
+    # 四条腿一次批量确认
+    state.long_put, state.short_put, state.short_call, state.long_call = await find_options(ib, stock, [
+        ("P", lower_strike, expiry),
+        ("P", atm_strike, expiry),
+        ("C", atm_strike, expiry),
+        ("C", upper_strike, expiry),
+    ])
 
     if not all([state.long_put, state.short_put, state.short_call, state.long_call]):
         raise RuntimeError("无法获取所有期权")
 
-    lp_price = await get_option_price(ib, state.long_put)
-    sp_price = await get_option_price(ib, state.short_put)
-    sc_price = await get_option_price(ib, state.short_call)
-    lc_price = await get_option_price(ib, state.long_call)
+    # 四条腿一次批量快照，全部返回后再计算
+    tickers = await ib.reqTickersAsync(
+        state.long_put, state.short_put, state.short_call, state.long_call)
+    lp_price, sp_price, sc_price, lc_price = (option_mark(t) for t in tickers)
 
     # 净收入 = 卖出 - 买入
     net_credit = (sp_price + sc_price - lp_price -
@@ -264,20 +383,47 @@ async def build_iron_butterfly(ib: IB, stock: Stock, state: StrategyState):
     state.position = IronButterflyPosition(
         atm_strike=atm_strike, lower_strike=lower_strike, upper_strike=upper_strike,
         expiry=expiry, contracts=NUM_CONTRACTS, initial_credit=net_credit, current_value=net_credit)
-
-
-async def update_position_value(ib: IB, state: StrategyState):
-    if not all([state.long_put, state.short_put, state.short_call, state.long_call]):
-        return
-    lp = await get_option_price(ib, state.long_put)
-    sp = await get_option_price(ib, state.short_put)
-    sc = await get_option_price(ib, state.short_call)
-    lc = await get_option_price(ib, state.long_call)
-    state.position.current_value = (sp + sc - lp - lc) * 100 * NUM_CONTRACTS
+    state.bar_template = make_bar_template(state.position)
+    if net_credit != 0:
+        # pnl_pct >= 止盈  <=>  current_value <= credit * (1 - 止盈)
+        # credit < 0 时两边同除负数，不等号反向，比较方向见 hit_exit
+        state.tp_value = net_credit * (1.0 - PROFIT_TARGET_PCT)
+        state.sl_value = net_credit * (1.0 + STOP_LOSS_PCT)
+    if net_credit <= 0:
+        logger.warning(f"⚠️ 未收到净权利金 (${net_credit:.2f})，"
+                       f"{'止盈/止损不会触发' if net_credit == 0 else '按净借方计算止盈/止损'}")
+
+
+def subscribe_market_data(ib: IB, stock: Stock, state: StrategyState):
+    """股票和四条腿建立流式订阅，之后价格由 IB 推送，检查时不再发请求"""
+    state.stock_ticker = ib.reqMktData(stock, "", False, False)
+    state.leg_tickers = tuple(
+        ib.reqMktData(opt, "", False, False)
+        for opt in (state.long_put, state.short_put, state.short_call, state.long_call))
+
+
+def cancel_market_data(ib: IB, state: StrategyState):
+    for ticker in (state.stock_ticker, *state.leg_tickers):
+        if ticker is not None:
+            ib.cancelMktData(ticker.contract)
+    state.stock_ticker = None
+    state.leg_tickers = ()
+
+
+def update_position_value(state: StrategyState):
+    """由已推送到的 ticker 计算股价和组合价值（纯计算，无 I/O）"""
+    stock_t = state.stock_ticker
+    price = stock_t.last or stock_t.close
+    if price and price == price:
+        state.current_price = price
+
+    lp, sp, sc, lc = (option_mark(t) for t in state.leg_tickers)
+    # 某条腿暂时没有报价时保留上次价值，避免误触发止损
+    if lp and sp and sc and lc:
+        state.position.current_value = (sp + sc - lp - lc) * 100 * NUM_CONTRACTS
 
 
 async def run_iron_butterfly(ib: IB):
-    global shutdown_requested
     logger.info("🦋 启动 Iron Butterfly 策略")
 
     stock = Stock(SYMBOL, EXCHANGE, CURRENCY)
@@ -287,33 +433,56 @@ async def run_iron_butterfly(ib: IB):
     await build_iron_butterfly(ib, stock, state)
     print_status(state, "建仓")
 
+    # 行情更新时唤醒主循环（回调里只置位，计算放在主循环）
+    def on_pending_tickers(tickers):
+        wake_event.set()
+
+    subscribe_market_data(ib, stock, state)
+    ib.pendingTickersEvent += on_pending_tickers
+    last_log = 0.0
     try:
-        while not shutdown_requested:
-            await asyncio.sleep(CHECK_INTERVAL_SEC)
-            state.current_price = await get_stock_price(ib, stock)
-            await update_position_value(ib, state)
+        while not shutdown_event.is_set():
+            # 行情长时间无更新时也按 CHECK_INTERVAL_SEC 心跳一次，照常打印状态和检查退出
+            try:
+                await asyncio.wait_for(wake_event.wait(), CHECK_INTERVAL_SEC)
+            except asyncio.TimeoutError:
+                pass
+            wake_event.clear()
+            if shutdown_event.is_set():
+                break
+            update_position_value(state)
 
-            pnl_pct = state.get_pnl_pct()
-            logger.info(
-                f"股价: ${state.current_price:.2f} | P&L: {pnl_pct:+.1%}")
+            now = time.monotonic()
+            if now - last_log >= CHECK_INTERVAL_SEC:
+                last_log = now
+                logger.info("股价: $%.2f | P&L: %+.1f%%",
+                            state.current_price, state.get_pnl_pct() * 100)
 
-            if pnl_pct >= PROFIT_TARGET_PCT or pnl_pct <= -STOP_LOSS_PCT:
+            # 直接与预先算好的价值阈值比较，每个 tick 不再做百分比除法
+            value = state.position.current_value
+            if state.hit_exit(value):
                 break
-    except KeyboardInterrupt:
-        pass
+    finally:
+        ib.pendingTickersEvent -= on_pending_tickers
+        cancel_market_data(ib, state)
 
     print_status(state, "结束")
 
 
-def handle_shutdown(signum, frame):
-    global shutdown_requested
-    shutdown_requested = True
-
-
 async def main():
     import signal
-    signal.signal(signal.SIGINT, handle_shutdown)
-    signal.signal(signal.SIGTERM, handle_shutdown)
+    loop = asyncio.get_running_loop()
+
+    def handle_shutdown(signum, frame):
+        # 信号处理函数不在事件循环内执行，需线程安全地唤醒主循环
+        loop.call_soon_threadsafe(request_shutdown)
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, request_shutdown)
+        except NotImplementedError:
+            # Windows 事件循环不支持 add_signal_handler
+            signal.signal(sig, handle_shutdown)
 
     ib = await connect_ib()
     try:
@@ -324,4 +493,4 @@ async def main():
 
 if __name__ == "__main__":
     print("🦋 Iron Butterfly - 卖ATM期权，收取高权利金")
-    asyncio.run(main())
+    run(main())
@@ -0,0 +1,90 @@
+"""
+通用行情/订单等待模块 - 多个策略共用
+
+提供功能：
+1. wait_for_ticker: 等待 ticker 满足条件（由 updateEvent 唤醒，不轮询）
+2. wait_for_done: 等待订单结束（由 statusEvent 唤醒）
+3. TickerPool: 每个合约只订阅一次并保持订阅的行情池
+
+使用方法：
+    from market_data import TickerPool, wait_for_ticker, has_price, wait_for_done
+
+    ticker_pool = TickerPool()   # 每个策略模块各自一个实例
+    ticker = await ticker_pool.get(ib, stock, has_price)
+    ticker_pool.release(ib, keep=(stock.conId,))
+"""
+import asyncio
+from typing import Optional, Dict, Tuple, Any
+
+from ib_async import IB
+
+
+async def wait_for_ticker(ticker, ready, timeout: float = 2.0):
+    """等待 ticker 满足 ready 条件（由 updateEvent 唤醒），最多 timeout 秒"""
+    if ready(ticker):
+        return
+    done = asyncio.Event()
+
+    def on_update(t):
+        if ready(t):
+            done.set()
+
+    ticker.updateEvent += on_update
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        ticker.updateEvent -= on_update
+
+
+def has_price(ticker) -> bool:
+    # NaN 与任何数比较均为 False
+    return ticker.last > 0 or ticker.close > 0
+
+
+async def wait_for_done(trade, timeout: Optional[float] = None):
+    """等待订单结束（成交/取消），由 statusEvent 唤醒；timeout=None 时一直等待"""
+    if trade.isDone():
+        return
+    done = asyncio.Event()
+
+    def on_status(t):
+        if t.isDone():
+            done.set()
+
+    trade.statusEvent += on_status
+    try:
+        await asyncio.wait_for(done.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        trade.statusEvent -= on_status
+
+
+class TickerPool:
+    """
+    行情订阅池
+
+    每个合约只订阅一次并保持订阅，后续检查直接读取实时 ticker，
+    只有新合约第一次读取时需要等待行情。平仓后调用 release 释放期权腿订阅。
+    """
+
+    def __init__(self):
+        # conId -> ticker；BAG 组合没有 conId，用各腿 conId 元组作键
+        self.tickers: Dict[Any, Any] = {}
+
+    async def get(self, ib: IB, contract, ready, generic_ticks: str = "",
+                  timeout: float = 2.0):
+        key = contract.conId or tuple(leg.conId for leg in contract.comboLegs)
+        ticker = self.tickers.get(key)
+        if ticker is None:
+            # 只在新订阅时等待；已订阅的直接读当前值（组合无报价时不会每轮都等满超时）
+            ticker = self.tickers[key] = ib.reqMktData(contract, generic_ticks, False, False)
+            await wait_for_ticker(ticker, ready, timeout)
+        return ticker
+
+    def release(self, ib: IB, keep: Tuple[int, ...] = ()):
+        """取消订阅（keep 中的 conId 保留）"""
+        for key in [k for k in self.tickers if k not in keep]:
+            ib.cancelMktData(self.tickers.pop(key).contract)
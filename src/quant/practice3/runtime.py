@@ -0,0 +1,50 @@
+"""
+通用运行环境模块 - 多个策略共用
+
+提供功能：
+1. setup_queue_logging: 日志经队列交给后台线程写终端，策略循环里的 logger 调用只做入队
+2. run: 安装了 uvloop 时用 libuv 事件循环运行主协程（未安装/Windows 自动回退）
+
+使用方法：
+    from runtime import setup_queue_logging, run
+
+    setup_queue_logging()
+    logger = logging.getLogger(__name__)
+    ...
+    if __name__ == "__main__":
+        run(main())
+"""
+import asyncio
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+_log_listener = None
+
+
+def setup_queue_logging(level: int = logging.INFO):
+    """根 logger 只挂 QueueHandler，由后台 QueueListener 线程格式化并写终端（重复调用无副作用）"""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(
+        "%(asctime)s - %(levelname)s - %(message)s"))
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # 最终格式由输出端负责
+    logging.basicConfig(level=level, handlers=[queue_handler])
+    _log_listener = QueueListener(log_queue, console_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+
+def run(main):
+    """运行主协程；安装了 uvloop 时使用 libuv 事件循环（Windows 不支持，自动回退）"""
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    return asyncio.run(main, loop_factory=loop_factory)
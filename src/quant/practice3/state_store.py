@@ -0,0 +1,143 @@
+"""
+通用仓位存储模块 - SQLite (WAL 模式)，多个策略共用一个数据库
+
+提供功能：
+1. 每个 (策略, 标的) 一行 JSON，保存只是一次 INSERT OR REPLACE，无需整文件重写
+2. journal_mode=WAL + synchronous=NORMAL，写入不阻塞读取，也不必每次 fsync
+3. 兼容旧版 .states/<strategy>_<symbol>.json 文件（首次读取时迁移入库）
+
+使用方法：
+    from state_store import StateStore
+
+    store = StateStore("iron_condor", SYMBOL)
+    data = store.load()          # -> Optional[Dict]
+    store.save(position.to_dict())
+    store.clear()
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    # orjson 可选：C 实现的序列化，未安装时退回标准库 json
+    import orjson
+
+    def dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = orjson.loads
+except ImportError:
+    def dumps(obj: Any) -> str:
+        return json.dumps(obj, separators=(',', ':'))
+
+    loads = json.loads
+
+# 数据库存储目录（与旧版 JSON 状态文件同目录）
+STATE_DIR = os.path.join(os.path.dirname(__file__), ".states")
+DB_FILE = os.path.join(STATE_DIR, "state.db")
+
+# WAL checkpoint 间隔：定期做 PASSIVE checkpoint，不在每次写入时做，避免写入停顿
+CHECKPOINT_INTERVAL_SEC = 3600
+
+_conn: Optional[sqlite3.Connection] = None
+_last_checkpoint = 0.0
+
+
+def get_connection() -> sqlite3.Connection:
+    """进程内共享连接（首次调用时建库建表）"""
+    global _conn, _last_checkpoint
+    if _conn is None:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        # isolation_level=None: 自动提交，每条语句即一个事务
+        _conn = sqlite3.connect(DB_FILE, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS positions ("
+            " strategy TEXT NOT NULL,"
+            " symbol TEXT NOT NULL,"
+            " blob TEXT NOT NULL,"
+            " last_updated TEXT NOT NULL,"
+            " PRIMARY KEY (strategy, symbol))"
+        )
+        _last_checkpoint = time.monotonic()
+    return _conn
+
+
+def maybe_checkpoint():
+    """距上次 checkpoint 超过 CHECKPOINT_INTERVAL_SEC 时把 WAL 合并回主库"""
+    global _last_checkpoint
+    now = time.monotonic()
+    if now - _last_checkpoint >= CHECKPOINT_INTERVAL_SEC:
+        get_connection().execute("PRAGMA wal_checkpoint(PASSIVE)")
+        _last_checkpoint = now
+
+
+class StateStore:
+    """单个 (策略, 标的) 的仓位存取"""
+
+    def __init__(self, strategy_name: str, symbol: str):
+        self.strategy_name = strategy_name
+        self.symbol = symbol.upper()
+        self.legacy_file = os.path.join(
+            STATE_DIR, f"{strategy_name}_{symbol.lower()}.json")
+        # (data_version, 仓位字典)：库未被其他连接修改时直接返回，免去查询和解码
+        self._cache: Optional[Tuple[int, Optional[Dict[str, Any]]]] = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """读取仓位字典，不存在返回 None"""
+        conn = get_connection()
+        # data_version 只在其他连接提交后变化；本连接的写入由 save/clear 清除缓存
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._cache is not None and self._cache[0] == version:
+            return self._cache[1]
+        
+        row = conn.execute(
+            "SELECT blob FROM positions WHERE strategy = ? AND symbol = ?",
+            (self.strategy_name, self.symbol),
+        ).fetchone()
+        position = loads(row[0]) if row else self._migrate_legacy()
+        self._cache = (version, position)
+        return position
+
+    def save(self, position: Dict[str, Any]):
+        """写入仓位字典（覆盖）"""
+        self._cache = None
+        get_connection().execute(
+            "INSERT OR REPLACE INTO positions (strategy, symbol, blob, last_updated) "
+            "VALUES (?, ?, ?, ?)",
+            (self.strategy_name, self.symbol, dumps(position), datetime.now().isoformat()),
+        )
+        maybe_checkpoint()
+
+    def clear(self) -> bool:
+        """删除仓位，返回是否确实删除了记录"""
+        self._cache = None
+        cur = get_connection().execute(
+            "DELETE FROM positions WHERE strategy = ? AND symbol = ?",
+            (self.strategy_name, self.symbol),
+        )
+        return cur.rowcount > 0
+
+    def _migrate_legacy(self) -> Optional[Dict[str, Any]]:
+        """
+        旧版 JSON 状态文件 → 数据库
+
+        迁移后旧文件改名为 *.migrated 保留在磁盘上（不删除，可人工恢复），
+        同时避免清仓后被重新读入
+        """
+        if not os.path.exists(self.legacy_file):
+            return None
+        with open(self.legacy_file, 'r') as f:
+            position = json.load(f)['position']
+        self.save(position)
+        migrated_file = self.legacy_file + ".migrated"
+        os.replace(self.legacy_file, migrated_file)
+        logger.info(f"已迁移旧版状态文件: {self.legacy_file} -> {DB_FILE}（原文件保留为 {migrated_file}）")
+        return position